@@ -5,7 +5,8 @@ import os
 import time
 import matplotlib.pyplot as plt
 
-from pidanalyze import __version__, loader, plotter, analyzer
+from pidanalyze import __version__, loader, analyzer, batch, cache
+from pidanalyze import fftbackend, pipeline
 
 # ----------------------------------------------------------------------------------
 # "THE BEER-WARE LICENSE" (Revision 42):
@@ -15,51 +16,6 @@ from pidanalyze import __version__, loader, plotter, analyzer
 # ----------------------------------------------------------------------------------
 
 
-def run_analysis(log_file_path, plot_name, blackbox_decode, show, noise_bounds):
-
-    tmp_dir = os.path.join(os.path.dirname(log_file_path), plot_name)
-    if not os.path.isdir(tmp_dir):
-        os.makedirs(tmp_dir)
-
-    loglist = loader.decode(log_file_path, tmp_dir, blackbox_decode)
-    heads = loader.beheader(loglist, tmp_dir)
-
-    figs = []
-    for head in heads:
-        fpath = head["tempFile"][:-3] + "01.csv"
-
-        logging.info("Reading: Log %s", head["logNum"])
-        data = loader.readcsv(fpath)
-        traces = loader.find_traces(data, head)
-
-        logging.info("Processing:")
-        analyzed = []
-        for trace_data in traces:
-            logging.info(trace_data["name"] + "...   ")
-            analyzed.append(analyzer.Trace(trace_data))
-        roll, pitch, yaw = analyzed
-
-        fig_resp = plotter.plot_all_resp(
-            fpath, head, [roll, pitch, yaw], analyzer.Trace.threshold
-        )
-        logging.info("Saving response plot as image...")
-        fig_resp.savefig(f"{fpath[:-13]}.{plot_name}_{head['logNum']}_response.png")
-
-        fig_noise = plotter.plot_all_noise(
-            fpath, head, [roll, pitch, yaw], noise_bounds
-        )
-        logging.info("Saving noise plot as image...")
-        fig_noise.savefig(f"{fpath[:-13]}.{plot_name}_{head['logNum']}_noise.png")
-
-        figs.append([fig_resp, fig_noise])
-        if show != "Y":
-            plt.cla()
-            plt.clf()
-
-    loader.deletejunk(loglist)
-    logging.info("Analysis complete, showing plot. (Close plot to exit.)")
-
-
 def strip_quotes(filepath):
     """Strips single or double quotes and extra whitespace from a string."""
     return filepath.strip().strip("'").strip('"')
@@ -69,6 +25,16 @@ def clean_path(path):
     return os.path.abspath(os.path.expanduser(strip_quotes(path)))
 
 
+def stage_workers(value):
+    """Parses the comma separated worker numbers of the pipeline stages."""
+    counts = [int(count) for count in value.split(",")]
+    if len(counts) != len(batch.STAGES) or min(counts) < 1:
+        raise argparse.ArgumentTypeError(
+            "expected %d numbers >= 1, one per stage" % len(batch.STAGES)
+        )
+    return dict(zip(batch.STAGES, counts))
+
+
 if __name__ == "__main__":
     logging.basicConfig(
         format="%(levelname)s %(asctime)s %(filename)s:%(lineno)s: %(message)s",
@@ -82,12 +48,127 @@ if __name__ == "__main__":
         action="append",
         help="BBL log file(s) to analyse. Omit for interactive prompt.",
     )
+    parser.add_argument(
+        "--batch",
+        action="append",
+        help="Log files, glob patterns or folders of logs to analyse in worker "
+        "processes without showing plots. Can be given several times.",
+    )
+    parser.add_argument(
+        "--batch_workers",
+        type=int,
+        default=None,
+        help="Worker processes for --batch. Default = number of cores",
+    )
+    parser.add_argument(
+        "--batch_mode",
+        choices=["processes", "pipeline"],
+        default="processes",
+        help="processes = analyse each session in one of --batch_workers processes. "
+        "pipeline = decode, parse, analyze and render sessions in overlapping "
+        "stages of one process. Default = processes",
+    )
+    parser.add_argument(
+        "--stage_workers",
+        type=stage_workers,
+        default=None,
+        help="Threads of the %s stages of --batch_mode pipeline, e.g. 2,1,1,1. "
+        "Default = 1 each" % ", ".join(batch.STAGES),
+    )
+    parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=pipeline.QUEUE_SIZE,
+        help="Sessions waiting in front of each stage of --batch_mode pipeline. "
+        "Default = %d" % pipeline.QUEUE_SIZE,
+    )
+    parser.add_argument(
+        "--summary",
+        default=None,
+        help="json file with status, timing and plots of every log of --batch. "
+        "Default = <name>_summary.json in the current folder",
+    )
     parser.add_argument("-n", "--name", default="tmp", help="Plot name.")
     parser.add_argument(
         "--blackbox_decode",
         default=os.path.join(os.getcwd(), "Blackbox_decode.exe"),
         help="Path to Blackbox_decode.exe.",
     )
+    parser.add_argument(
+        "--decoder",
+        choices=["native", "blackbox_decode", "blackbox_decode_csv"],
+        default="blackbox_decode",
+        help="native = built-in BBL decoder, compiled with numba if installed.\nblackbox_decode = use Blackbox_decode.exe, read its output from a pipe."
+        "\nblackbox_decode_csv = use Blackbox_decode.exe through temp csv files. \nDefault = blackbox_decode",
+    )
+    parser.add_argument(
+        "--decode_workers",
+        type=int,
+        default=None,
+        help="Number of sessions decoded at once. Default = number of cores",
+    )
+    parser.add_argument(
+        "--decode_timeout",
+        type=float,
+        default=None,
+        help="Seconds before Blackbox_decode.exe is stopped for a session. Default = %d"
+        % loader.DECODE_TIMEOUT,
+    )
+    parser.add_argument(
+        "--cache_dir",
+        default=cache.CACHE_DIR,
+        help="Folder for the cache of decoded sessions. Default = %s" % cache.CACHE_DIR,
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Decode every session again, without reading or filling the cache.",
+    )
+    parser.add_argument(
+        "--resp_rate",
+        type=float,
+        default=None,
+        help="Sample rate in Hz for the step response analysis, e.g. 1000. Faster, "
+        "the log is decimated for it. Default = rate of the log",
+    )
+    parser.add_argument(
+        "--fft",
+        choices=fftbackend.BACKENDS,
+        default="numpy",
+        help="FFT library for the analysis. scipy and pyfftw use several threads. "
+        "Default = numpy",
+    )
+    parser.add_argument(
+        "--fft_workers",
+        type=int,
+        default=None,
+        help="Threads per FFT for --fft scipy or pyfftw. Default = number of cores",
+    )
+    parser.add_argument(
+        "--axis_mode",
+        choices=analyzer.AXIS_MODES,
+        default="batched",
+        help="batched = analyse roll, pitch and yaw together in one pass. threads / "
+        "processes = analyse each axis in its own worker. Default = batched",
+    )
+    parser.add_argument(
+        "--axis_workers",
+        type=int,
+        default=None,
+        help="Workers for --axis_mode threads or processes. Default = one per axis",
+    )
+    parser.add_argument(
+        "--no_decimate",
+        action="store_true",
+        help="Draw every sample of the time traces in saved plots, instead of their "
+        "min/max per pixel column. Slower, looks the same.",
+    )
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        help="Save small plots of a quick, coarse analysis of every log first. "
+        "The full plots replace them when done.",
+    )
     parser.add_argument(
         "-s",
         "--show",
@@ -108,34 +189,84 @@ if __name__ == "__main__":
 
     except:
         args.noise_bounds = args.noise_bounds
-    if not os.path.isfile(blackbox_decode_path):
-        parser.error(
-            (
-                "Could not find Blackbox_decode.exe (used to generate CSVs from "
-                "your BBL file) at %s. You may need to install it from "
-                "https://github.com/cleanflight/blackbox-tools/releases."
+    args.stream = args.decoder != "blackbox_decode_csv"
+    if args.decoder == "native":
+        args.blackbox_decode = None
+        logging.info("Decoding with built-in decoder")
+    else:
+        if not os.path.isfile(blackbox_decode_path):
+            parser.error(
+                (
+                    "Could not find Blackbox_decode.exe (used to generate CSVs from "
+                    "your BBL file) at %s. You may need to install it from "
+                    "https://github.com/cleanflight/blackbox-tools/releases."
+                )
+                % blackbox_decode_path
             )
-            % blackbox_decode_path
-        )
-    logging.info("Decoding with %r" % blackbox_decode_path)
+        logging.info("Decoding with %r" % blackbox_decode_path)
+
+    session_cache = None if args.no_cache else cache.SessionCache(args.cache_dir)
+    analyzer.Trace.resp_rate = args.resp_rate
+    try:
+        analyzer.Trace.fft = fftbackend.get_backend(args.fft, args.fft_workers)
+    except ImportError as error:
+        parser.error("FFT backend %s is not available: %s" % (args.fft, error))
 
     logging.info("PID Analyzer: %s", __version__)
     logging.info("Hello Pilot!")
 
-    if args.log:
+    if args.batch:
+        settings = {
+            "plot_name": args.name,
+            "blackbox_decode": args.blackbox_decode,
+            "noise_bounds": args.noise_bounds,
+            "decode_workers": args.decode_workers or 1,
+            "decode_timeout": args.decode_timeout,
+            "stream": args.stream,
+            "cache_dir": None if args.no_cache else args.cache_dir,
+            "axis_mode": args.axis_mode,
+            "axis_workers": args.axis_workers,
+            "decimate": not args.no_decimate,
+            "preview": args.preview,
+        }
+        summary_path = args.summary or f"{args.name}_summary.json"
+        if args.batch_mode == "pipeline":
+            summary = batch.run_pipeline(
+                batch.find_logs(args.batch),
+                settings,
+                args.stage_workers,
+                args.queue_size,
+                summary_path,
+            )
+        else:
+            summary = batch.run_batch(
+                batch.find_logs(args.batch), settings, args.batch_workers, summary_path
+            )
+        failed = [log["log"] for log in summary["logs"] if log["status"] != "ok"]
+        for log_path in failed:
+            logging.warning("Not every session analysed: %s", log_path)
+
+    elif args.log:
         for log_path in args.log:
-            run_analysis(
+            batch.run_analysis(
                 clean_path(log_path),
                 args.name,
                 args.blackbox_decode,
                 args.show,
                 args.noise_bounds,
+                args.decode_workers,
+                args.decode_timeout,
+                args.stream,
+                session_cache,
+                args.axis_mode,
+                args.axis_workers,
+                decimate=not args.no_decimate,
+                preview=args.preview,
             )
         if args.show.upper() == "Y":
             plt.show()
         else:
-            plt.cla()
-            plt.clf()
+            plt.close("all")
 
     else:
         while True:
@@ -176,17 +307,24 @@ if __name__ == "__main__":
 
             for p in raw_paths:
                 if os.path.isfile(clean_path(p)):
-                    run_analysis(
+                    batch.run_analysis(
                         clean_path(p),
                         name,
                         args.blackbox_decode,
                         args.show,
                         args.noise_bounds,
+                        args.decode_workers,
+                        args.decode_timeout,
+                        args.stream,
+                        session_cache,
+                        args.axis_mode,
+                        args.axis_workers,
+                        decimate=not args.no_decimate,
+                        preview=args.preview,
                     )
                 else:
                     logging.info("No valid input path!")
             if args.show == "Y":
                 plt.show()
             else:
-                plt.cla()
-                plt.clf()
+                plt.close("all")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+"""Compares decoding BBL sessions with pidanalyze.decoder against Blackbox_decode.
+
+By default a synthetic log is written first, 5 sessions of 60 seconds at
+4 kHz, and the columns decoded by pidanalyze.decoder are checked against the
+values that were encoded. --log decodes a real log instead.
+
+    python benchmarks/bench_decode.py --sessions 5 --seconds 60
+    python benchmarks/bench_decode.py --log LOG00001.BFL --blackbox_decode ./blackbox_decode
+
+With Blackbox_decode (--blackbox_decode or on the PATH) every session is
+decoded by both, timed from the log to the columns the analysis reads, and
+the columns of both are compared. pidanalyze.decoder is compiled with numba
+when it is installed, the compile time of the first call is reported apart.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from pidanalyze import csvreader, decoder, loader  # noqa: E402
+from synthetic import make_bbl  # noqa: E402
+
+
+def compare(expected, result):
+    ### largest absolute difference of the columns in both, None if their
+    ### lengths differ
+    keys = sorted(expected.keys() & result.keys())
+    if any(len(expected[key]) != len(result[key]) for key in keys):
+        return None
+    return max(
+        (np.abs(expected[key] - result[key]).max() for key in keys if len(result[key])),
+        default=0.0,
+    )
+
+
+def native(index, heads):
+    columns = []
+    for head in heads:
+        number, offset, length = head["session"]
+        columns.append(
+            decoder.decode_session(
+                index.buf, offset, offset + length, wanted=loader.WANTED_FIELDS
+            )
+        )
+    return columns
+
+
+def blackbox_decode(index, heads, bin_path):
+    ### the csv columns of each session, from Blackbox_decode --stdout
+    columns = []
+    for head in heads:
+        index.write(head["session"], head["tempFile"])
+        try:
+            process = subprocess.Popen(
+                [bin_path, "--stdout", head["tempFile"]],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            with process:
+                columns.append(
+                    csvreader.read_stream(process.stdout, loader.WANTED_FIELDS)
+                )
+        finally:
+            os.remove(head["tempFile"])
+    return columns
+
+
+def best_of(repeat, func, *args):
+    ### the fastest of repeat runs, and the result of the last one
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log", default=None, help="real BBL to decode")
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--blackbox_decode", default=shutil.which("blackbox_decode"))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        expected = None
+        path = args.log
+        if path is None:
+            path = os.path.join(tmp, "bench.BBL")
+            frames = int(args.seconds * 4000)  # P interval 1/2 of 8 kHz
+            expected = []
+            with open(path, "wb") as bbl:
+                for seed in range(args.sessions):
+                    session, columns = make_bbl(frames, seed)
+                    bbl.write(session)
+                    expected.append(columns)
+
+        index = loader.SessionIndex(path)
+        heads = loader.beheader(index, tmp)
+        print(
+            f"{len(heads)} sessions, {os.path.getsize(path) / 1e6:.0f} MB, "
+            f"numba {'on' if decoder.COMPILED else 'off'}"
+        )
+
+        start = time.perf_counter()
+        decoder.decode_session(make_bbl(10)[0])
+        print(f"{'first call':16s} {time.perf_counter() - start:7.2f}s")
+
+        seconds, result = best_of(args.repeat, native, index, heads)
+        frames = sum(len(columns["time (us)"]) for columns in result)
+        print(
+            f"{'decoder':16s} {seconds:7.2f}s "
+            f"{seconds / max(frames, 1) * 1e6:6.2f} us/frame"
+        )
+        if expected is not None:
+            diffs = [compare(e, r) for e, r in zip(expected, result)]
+            print("decoder matches the encoded values:", diffs == [0.0] * len(diffs))
+
+        if args.blackbox_decode:
+            seconds, reference = best_of(
+                args.repeat, blackbox_decode, index, heads, args.blackbox_decode
+            )
+            print(
+                f"{'Blackbox_decode':16s} {seconds:7.2f}s "
+                f"{seconds / max(frames, 1) * 1e6:6.2f} us/frame"
+            )
+            for head, ref, res in zip(heads, reference, result):
+                diff = compare(ref, res)
+                print(
+                    f"session {head['session'][0]}: "
+                    + ("lengths differ" if diff is None else f"max abs diff {diff:g}")
+                )
+        else:
+            print("no Blackbox_decode given, comparison skipped")
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
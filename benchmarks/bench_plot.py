@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""Figure creation plus savefig of the response and noise plots of one log.
+
+    python benchmarks/bench_plot.py --seconds 600 --rate 8000
+    python benchmarks/bench_plot.py --repo ../PID-Analyzer-old
+
+Renders the plots with every sample of the time traces and with their
+min/max per pixel column (the default), reports the time of both and how
+many pixels of the PNGs differ. --repo renders them with the pidanalyze of
+another checkout as well, to compare versions.
+"""
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib.image as mpimg
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from pidanalyze import analyzer, loader, plotter  # noqa: E402
+from synthetic import make_traces  # noqa: E402
+
+HEAD = loader.Header(dict(loader.HEAD_DEFAULTS, logNum="0", tpa_breakpoint="1500"))
+
+
+def render(traces, **options):
+    ### seconds to make and save both plots, and the PNGs
+    start = time.perf_counter()
+    pngs = []
+    for fig in (
+        plotter.plot_all_resp("bench", HEAD, traces, 500.0, **options),
+        plotter.plot_all_noise("bench", HEAD, traces, "auto", **options),
+    ):
+        png = io.BytesIO()
+        fig.savefig(png, format="png")
+        pngs.append(png.getvalue())
+    return time.perf_counter() - start, pngs
+
+
+def differing_pixels(png_a, png_b):
+    a = mpimg.imread(io.BytesIO(png_a), format="png")
+    b = mpimg.imread(io.BytesIO(png_b), format="png")
+    return int((np.abs(a - b).max(axis=-1) > 1.0 / 255).sum()), a.shape[0] * a.shape[1]
+
+
+def render_with(repo, seconds, rate, path):
+    ### renders the default plots with the pidanalyze of repo in a fresh process,
+    ### returns the seconds and the PNGs written to path
+    script = (
+        "import sys\n"
+        f"sys.path[:0] = [{repo!r}, {os.path.dirname(__file__)!r}]\n"
+        "from pidanalyze import analyzer\n"
+        "import bench_plot\n"
+        "from synthetic import make_traces\n"
+        f"traces = analyzer.MultiTrace(make_traces({seconds}, {rate})).traces\n"
+        "seconds, pngs = bench_plot.render(traces)\n"
+        f"open({path!r} + '_resp.png', 'wb').write(pngs[0])\n"
+        f"open({path!r} + '_noise.png', 'wb').write(pngs[1])\n"
+        "print(seconds)\n"
+    )
+    output = subprocess.check_output([sys.executable, "-c", script], cwd=repo)
+    seconds = float(output.split()[-1])
+    pngs = []
+    for suffix in ("_resp.png", "_noise.png"):
+        with open(path + suffix, "rb") as png:
+            pngs.append(png.read())
+        os.remove(path + suffix)
+    return seconds, pngs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=600.0)
+    parser.add_argument("--rate", type=float, default=8000.0)
+    parser.add_argument("--repo", help="other checkout to compare the plots with")
+    args = parser.parse_args()
+
+    if args.repo:
+        results = []
+        tmp_dir = tempfile.mkdtemp()
+        for repo in (os.path.abspath(args.repo), REPO):
+            path = os.path.join(tmp_dir, f"bench_plot_{len(results)}")
+            results.append(render_with(repo, args.seconds, args.rate, path))
+            print(f"{repo}  {results[-1][0]:7.2f}s")
+        print(f"speedup {results[0][0] / results[1][0]:.1f}x")
+        for name, other, this in zip(("response", "noise"), *(r[1] for r in results)):
+            count, total = differing_pixels(other, this)
+            print(f"{name:8s} {count} of {total} pixels differ")
+        os.rmdir(tmp_dir)
+        return
+
+    traces = analyzer.MultiTrace(make_traces(args.seconds, args.rate)).traces
+    full_time, full_pngs = render(traces, decimate=False)
+    dec_time, dec_pngs = render(traces, decimate=True)
+    print(f"every sample     {full_time:7.2f}s")
+    print(f"min/max decimate {dec_time:7.2f}s  ({full_time / dec_time:.1f}x)")
+    for name, full, dec in zip(("response", "noise"), full_pngs, dec_pngs):
+        count, total = differing_pixels(full, dec)
+        print(f"{name:8s} {count} of {total} pixels differ")
+
+
+if __name__ == "__main__":
+    main()
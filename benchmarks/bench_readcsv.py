@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Compares reading a blackbox csv with pandas against pidanalyze.csvreader.
+
+A synthetic csv with the columns of a Betaflight log is written first,
+by default 10 minutes at 8 kHz. csvreader is timed as installed (parsing
+with pandas if it is there) and as without pandas (np.loadtxt), reading
+the file and reading it from a pipe as the stdout of Blackbox_decode.
+
+    python benchmarks/bench_readcsv.py --seconds 600 --rate 8000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from pidanalyze import csvreader, loader  # noqa: E402
+
+COLUMNS = (
+    ["loopIteration", "time (us)"]
+    + [f"axis{term}[{i}]" for term in "PID" for i in range(3)]
+    + [f"rcCommand[{i}]" for i in range(4)]
+    + [f"setpoint[{i}]" for i in range(4)]
+    + ["vbatLatest (V)", "amperageLatest (A)", "rssi"]
+    + [f"gyroADC[{i}]" for i in range(3)]
+    + [f"accSmooth[{i}]" for i in range(3)]
+    + [f"debug[{i}]" for i in range(4)]
+    + [f"motor[{i}]" for i in range(4)]
+    + ["energyCumulative (mAh)", "flightModeFlags (flags)", "stateFlags (flags)"]
+)
+
+
+def write_csv(path, rows, rate, blockrows=100000):
+    rng = np.random.RandomState(0)
+    numeric = len(COLUMNS) - 2
+    with open(path, "w") as csv_file:
+        csv_file.write(", ".join(COLUMNS) + "\n")
+        for start in range(0, rows, blockrows):
+            n = min(blockrows, rows - start)
+            block = rng.randint(-500, 2000, (n, numeric))
+            block[:, 0] = np.arange(start, start + n)
+            block[:, 1] = (block[:, 0] * (1e6 / rate)).astype(np.int64)
+            csv_file.writelines(
+                ", ".join(map(str, row)) + ", ANGLE_MODE, ARMED\n"
+                for row in block.tolist()
+            )
+
+
+def timed(code):
+    ### runs code in a fresh interpreter, so imports are part of the timing
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, "-c", code])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=600.0)
+    parser.add_argument("--rate", type=float, default=8000.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = int(args.seconds * args.rate)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.01.csv")
+        write_csv(path, rows, args.rate)
+        print(f"{rows} rows, {os.path.getsize(path) / 1e6:.0f} MB")
+
+        wanted = sorted(loader.WANTED_FIELDS)
+        pandas_code = (
+            "import numpy as np\n"
+            "from pandas import read_csv\n"
+            f"wanted = set({wanted!r})\n"
+            f"read_csv({path!r}, header=0, skipinitialspace=1,"
+            " usecols=lambda k: k in wanted, dtype=np.float64)\n"
+        )
+        csvreader_code = (
+            f"import sys; sys.path.insert(0, {REPO!r})\n"
+            "from pidanalyze import csvreader\n"
+            f"csvreader.read_csv({path!r}, set({wanted!r}))\n"
+        )
+        # read_stream on a pipe, as run_blackbox_stream reads Blackbox_decode
+        stream_code = (
+            f"import subprocess, sys; sys.path.insert(0, {REPO!r})\n"
+            "from pidanalyze import csvreader\n"
+            f"process = subprocess.Popen(['cat', {path!r}], stdout=subprocess.PIPE)\n"
+            "with process:\n"
+            f"    csvreader.read_stream(process.stdout, set({wanted!r}))\n"
+        )
+        # csvreader as without pandas installed, parsing with np.loadtxt
+        no_pandas = "import sys; sys.modules['pandas'] = None\n"
+        for name, code in (
+            ("pandas", pandas_code),
+            ("csvreader", csvreader_code),
+            ("loadtxt", no_pandas + csvreader_code),
+            ("stream", stream_code),
+            ("stream loadtxt", no_pandas + stream_code),
+        ):
+            best = min(timed(code) for _ in range(args.repeat))
+            print(f"{name:14s} {best:7.2f}s")
+
+        # both must give the same data dict
+        from pandas import read_csv
+
+        dframe = read_csv(
+            path,
+            header=0,
+            skipinitialspace=1,
+            usecols=lambda k: k in wanted,
+            dtype=np.float64,
+        )
+        expected = loader.build_data({key: dframe[key].values for key in dframe})
+        result = loader.build_data(csvreader.read_csv(path, set(wanted)))
+        sys.modules["pandas"] = None
+        fallback = loader.build_data(csvreader.read_csv(path, set(wanted)))
+        for columns in (result, fallback):
+            assert expected.keys() == columns.keys()
+            for key in expected:
+                np.testing.assert_array_equal(expected[key], columns[key])
+        print("data dicts identical")
+
+
+if __name__ == "__main__":
+    main()
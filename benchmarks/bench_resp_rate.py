@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Step response analysis at the log rate against decimated to Trace.resp_rate.
+
+    python benchmarks/bench_resp_rate.py --seconds 120 --rate 8000 --resp_rate 1000
+
+Reports the analysis time of both and how far the decimated step
+responses are from the full rate ones.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pidanalyze import analyzer  # noqa: E402
+from synthetic import make_traces  # noqa: E402
+
+
+def analyse(traces, resp_rate):
+    analyzer.Trace.resp_rate = resp_rate
+    start = time.perf_counter()
+    result = analyzer.MultiTrace(traces).traces
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=120.0)
+    parser.add_argument("--rate", type=float, default=8000.0)
+    parser.add_argument("--resp_rate", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    traces = make_traces(args.seconds, args.rate)
+    full, full_time = analyse(traces, None)
+    decimated, decimated_time = analyse(traces, args.resp_rate)
+    print(f"full rate   {full_time:7.2f}s")
+    speedup = full_time / decimated_time
+    print(f"{args.resp_rate:g} Hz {decimated_time:9.2f}s  ({speedup:.1f}x)")
+
+    for tr_full, tr_dec in zip(full, decimated):
+        for name in ("resp_sm", "resp_low", "resp_high"):
+            if not hasattr(tr_full, name) or not hasattr(tr_dec, name):
+                continue
+            # decimated curve on the full rate time axis
+            curve = np.interp(
+                tr_full.time_resp, tr_dec.time_resp, getattr(tr_dec, name)[0]
+            )
+            deviation = np.max(np.abs(curve - getattr(tr_full, name)[0]))
+            print(f"{tr_full.name:5s} {name:9s} max deviation {deviation:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""Synthetic flight data for the benchmarks, shaped like loader.find_traces output."""
+
+import numpy as np
+
+
+def make_traces(seconds=60.0, rate=8000.0, seed=0):
+    ### roll, pitch and yaw with stepped setpoints, a delayed first order-ish
+    ### response, sensor noise and a 300Hz motor noise line
+    rng = np.random.RandomState(seed)
+    n = int(seconds * rate)
+    time = np.sort(np.arange(n) / rate + rng.uniform(-0.2, 0.2, n) / rate)
+    throttle = 30.0 + 30.0 * np.sin(time * 0.3)
+    throttle = np.clip(throttle + 5.0 * rng.randn(n).cumsum() / np.sqrt(n), 0.0, 100.0)
+    motor_noise = 20.0 * np.sin(2.0 * np.pi * 300.0 * time)
+
+    response = np.zeros(int(0.05 * rate))
+    response[int(0.004 * rate) :] = 1.0
+    response /= response.sum()
+
+    traces = []
+    for i, name in enumerate(["roll", "pitch", "yaw"]):
+        steps = rng.randn(int(seconds * 2) + 2) * 300.0 * (1 + i)
+        setpoint = np.repeat(steps, int(rate / 2))[:n]
+        setpoint = np.convolve(setpoint, np.ones(40) / 40.0, mode="same")
+        gyro = np.convolve(setpoint, response)[:n] + rng.randn(n) * 5.0 + motor_noise
+        p_err = (setpoint - gyro) * 0.032029 * 45.0
+        d_err = np.gradient(gyro) * 10.0 + rng.randn(n)
+        traces.append(
+            {
+                "name": name,
+                "time": time,
+                "throttle": throttle,
+                "p_err": p_err,
+                "rcinput": setpoint / 2.0,
+                "gyro": gyro,
+                "PIDsum": p_err + d_err,
+                "d_err": d_err,
+                "debug": gyro + rng.randn(n) * 10.0,
+                "P": 45.0,
+            }
+        )
+    return traces
+
+
+### a Betaflight style main frame: field, I predictor, I encoding, P predictor and
+### P encoding. see pidanalyze.decoder for the numbers.
+BBL_FIELDS = (
+    [("loopIteration", 0, 1, 6, 9), ("time", 0, 1, 2, 0)]
+    + [(f"axisP[{i}]", 0, 0, 1, 0) for i in range(3)]
+    + [(f"axisI[{i}]", 0, 0, 1, 7) for i in range(3)]
+    + [(f"axisD[{i}]", 0, 0, 1, 0) for i in range(2)]
+    + [(f"rcCommand[{i}]", 0, 0, 1, 8) for i in range(3)]
+    + [("rcCommand[3]", 4, 1, 1, 8), ("vbatLatest", 9, 3, 1, 6)]
+    + [(f"gyroADC[{i}]", 0, 0, 3, 0) for i in range(3)]
+    + [(f"debug[{i}]", 0, 0, 3, 10) for i in range(3)]
+    + [("debug[3]", 0, 0, 3, 6), ("motor[0]", 11, 1, 3, 0)]
+    + [(f"motor[{i}]", 5, 0, 3, 0) for i in range(1, 4)]
+)
+BBL_MINTHROTTLE = 1070
+BBL_MOTOR_LOW = 48
+
+
+def bbl_header(p_interval, i_interval):
+    names, i_pred, i_enc, p_pred, p_enc = zip(*BBL_FIELDS)
+    lines = [
+        "Product:Blackbox flight data recorder by Nicholas Sherlock",
+        "Data version:2",
+        f"I interval:{i_interval}",
+        f"P interval:{p_interval}",
+        "Field I name:" + ",".join(names),
+        "Field I signed:" + ",".join(["0", "0"] + ["1"] * (len(names) - 2)),
+        "Field I predictor:" + ",".join(map(str, i_pred)),
+        "Field I encoding:" + ",".join(map(str, i_enc)),
+        "Field P predictor:" + ",".join(map(str, p_pred)),
+        "Field P encoding:" + ",".join(map(str, p_enc)),
+        "Field S name:flightModeFlags,stateFlags",
+        "Field S signed:0,0",
+        "Field S predictor:0,0",
+        "Field S encoding:1,1",
+        "Firmware type:Cleanflight",
+        "Firmware revision:Betaflight 3.5.0 (8d8ee3a) STM32F7X2",
+        "Firmware date:Oct  2 2018 12:00:00",
+        "Craft name:synthetic",
+        f"minthrottle:{BBL_MINTHROTTLE}",
+        "maxthrottle:2000",
+        f"motorOutput:{BBL_MOTOR_LOW},2047",
+        "vbatref:4095",
+        "rollPID:45,50,20",
+        "pitchPID:47,50,22",
+        "yawPID:45,50,0",
+        "tpa_breakpoint:1650",
+        "rates:70,70,70",
+        "gyro_lowpass_hz:100",
+        "dterm_lpf_hz:100",
+        "debug_mode:3",
+    ]
+    return "".join(f"H {line}\n" for line in lines).encode("latin-1")
+
+
+def unsigned_vb(value):
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def signed_vb(value):
+    return unsigned_vb((value << 1) ^ (value >> 31))
+
+
+def fits(value, bits):
+    return -(1 << bits - 1) <= value < 1 << bits - 1
+
+
+def whole_bytes(values):
+    selector = 0xC0
+    out = b""
+    for j, value in enumerate(values):
+        width = next(w for w in (1, 2, 3, 4) if fits(value, 8 * w))
+        selector |= width - 1 << 2 * j
+        out += (value & (1 << 8 * width) - 1).to_bytes(width, "little")
+    return bytes([selector]) + out
+
+
+def tag2_3s32(a, b, c):
+    if fits(a, 2) and fits(b, 2) and fits(c, 2):
+        return bytes([(a & 3) << 4 | (b & 3) << 2 | c & 3])
+    if fits(a, 4) and fits(b, 4) and fits(c, 4):
+        return bytes([0x40 | a & 15, (b & 15) << 4 | c & 15])
+    if fits(a, 6) and fits(b, 6) and fits(c, 6):
+        return bytes([0x80 | a & 63, b & 63, c & 63])
+    return whole_bytes((a, b, c))
+
+
+def tag2_3svariable(a, b, c):
+    if fits(a, 2) and fits(b, 2) and fits(c, 2):
+        return bytes([(a & 3) << 4 | (b & 3) << 2 | c & 3])
+    if fits(a, 5) and fits(b, 5) and fits(c, 4):
+        return bytes([0x40 | (a & 31) << 1 | (b & 31) >> 4, (b & 15) << 4 | c & 15])
+    if fits(a, 8) and fits(b, 7) and fits(c, 7):
+        a, b, c = a & 255, b & 127, c & 127
+        return bytes([0x80 | a >> 2, (a & 3) << 6 | b >> 1, (b & 1) << 7 | c])
+    return whole_bytes((a, b, c))
+
+
+def tag8_4s16(values):
+    ### data version 2, the fields packed in nibbles
+    selector = 0
+    nibbles = []
+    for j, value in enumerate(values):
+        if value == 0:
+            size = 0
+        elif fits(value, 4):
+            size = 1
+        elif fits(value, 8):
+            size = 2
+        else:
+            size = 4
+        selector |= min(size, 3) << 2 * j
+        nibbles += [value >> 4 * k & 15 for k in reversed(range(size))]
+    nibbles += [0] * (len(nibbles) % 2)
+    return bytes([selector]) + bytes(
+        hi << 4 | lo for hi, lo in zip(nibbles[::2], nibbles[1::2])
+    )
+
+
+def tag8_8svb(values):
+    if len(values) == 1:
+        return signed_vb(values[0])
+    header = sum(1 << j for j, value in enumerate(values) if value)
+    return bytes([header]) + b"".join(signed_vb(v) for v in values if v)
+
+
+def predict(predictor, i, current, previous, previous2, skipped):
+    if predictor == 1:
+        return previous[i]
+    if predictor == 2:
+        return 2 * previous[i] - previous2[i]
+    if predictor == 3:
+        both = previous[i] + previous2[i]
+        return both // 2 if both >= 0 else -(-both // 2)
+    if predictor == 4:
+        return BBL_MINTHROTTLE
+    if predictor == 5:
+        return current[len(BBL_FIELDS) - 4]  # motor[0]
+    if predictor == 6:
+        return previous[i] + skipped + 1
+    if predictor == 9:
+        return 4095
+    if predictor == 11:
+        return BBL_MOTOR_LOW
+    return 0
+
+
+def encode_frame(kind, current, previous, previous2, skipped):
+    column = 1 if kind == "I" else 3
+    predictors = [field[column] for field in BBL_FIELDS]
+    encodings = [field[column + 1] for field in BBL_FIELDS]
+    raw = [
+        value - predict(p, i, current, previous, previous2, skipped)
+        for i, (p, value) in enumerate(zip(predictors, current))
+    ]
+    out = kind.encode()
+    i = 0
+    while i < len(raw):
+        encoding = encodings[i]
+        n = 1
+        if encoding == 0:
+            out += signed_vb(raw[i])
+        elif encoding == 1:
+            out += unsigned_vb(raw[i])
+        elif encoding == 3:
+            out += unsigned_vb(-raw[i] & 0x3FFF)
+        elif encoding == 6:
+            while n < 8 and i + n < len(raw) and encodings[i + n] == 6:
+                n += 1
+            out += tag8_8svb(raw[i : i + n])
+        elif encoding == 7:
+            n = 3
+            out += tag2_3s32(*raw[i : i + 3])
+        elif encoding == 8:
+            n = 4
+            out += tag8_4s16(raw[i : i + 4])
+        elif encoding == 10:
+            n = 3
+            out += tag2_3svariable(*raw[i : i + 3])
+        i += n
+    return out
+
+
+def make_bbl(frames=8000, seed=0, p_interval="1/2", i_interval=32):
+    """One BBL session of random walk fields, and the columns it decodes to.
+
+    Uses the predictors and encodings of Betaflight main frames, with slow
+    frames and events in between. The columns are named like the csv of
+    blackbox_decode.
+    """
+    rng = np.random.RandomState(seed)
+    num, denom = map(int, p_interval.split("/"))
+    out = bytearray(bbl_header(p_interval, i_interval))
+    rows = []
+    values = np.zeros(len(BBL_FIELDS), dtype=np.int64)
+    previous = previous2 = None
+    iteration = 0
+    time = 1000000
+    while len(rows) < frames:
+        if (iteration % i_interval + num - 1) % denom >= num:
+            iteration += 1
+            continue
+        skipped = iteration - rows[-1][0] - 1 if rows else 0
+        time += 125 * (skipped + 1) + rng.randint(-3, 4)
+        values[2:] += rng.randint(-60, 61, len(values) - 2)
+        values[13] = 1000 + len(rows) % 500  # throttle, also below minthrottle
+        values[14] = 3700 - len(rows) % 50
+        values[-4:] = np.clip(values[-4:], 200, 1800)
+        current = [iteration, time] + values[2:].tolist()
+        if iteration % i_interval == 0 or previous is None:
+            out += encode_frame("I", current, previous, previous2, 0)
+            previous = previous2 = current
+        else:
+            out += encode_frame("P", current, previous, previous2, skipped)
+            previous, previous2 = current, previous
+        rows.append(current)
+        iteration += 1
+        if len(rows) % 97 == 0:
+            out += b"S" + unsigned_vb(3) + unsigned_vb(1)
+        if len(rows) % 331 == 0:
+            out += b"E\x00" + unsigned_vb(time)  # sync beep
+    out += b"E\xffEnd of log\x00"
+
+    table = np.array(rows, dtype=np.float64)
+    names = [{"time": "time (us)"}.get(field[0], field[0]) for field in BBL_FIELDS]
+    return bytes(out), {name: table[:, j] for j, name in enumerate(names)}
@@ -1,7 +1,177 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
 import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy.fftpack import next_fast_len
 from scipy.interpolate import interp1d
 from scipy.ndimage.filters import gaussian_filter1d
 from scipy.optimize import minimize
+from scipy.signal import decimate
+
+from . import fftbackend
+
+FILTER_CACHE_SIZE = 32  # filters and axes kept for reuse, per (length, dt, cutfreq)
+DT_STEP = 0.125e-6  # loop times are multiples of 1/8 us (31.25, 125, 312.5 us ...)
+
+
+def nominal_dt(dt):
+    ### sample time snapped to the loop time it was logged at, so the timing jitter
+    ### of a log does not change the filters and logs of the same rate share them
+    return round(dt / DT_STEP) * DT_STEP
+
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def hann_window(length):
+    window = np.hanning(length)
+    window.flags.writeable = False
+    return window
+
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def rfft_freq(length, dt):
+    freq = np.fft.rfftfreq(length, dt)
+    freq.flags.writeable = False
+    return freq
+
+
+@lru_cache(maxsize=FILTER_CACHE_SIZE)
+def wiener_regularizer(length, dt, cutfreq):
+    """1/sn of the Wiener deconvolution for the rfft bins of ``length`` samples.
+
+    sn is 0 below cutfreq, 1 above, with a gaussian transition. It is
+    built on the full two-sided spectrum, as with complex transforms, and
+    cached per (length, dt, cutfreq), with dt from nominal_dt. Deconvolutions
+    through the rfft match the former complex fft within 1e-9 relative for
+    the same length and dt.
+    """
+    freq = np.abs(np.fft.fftfreq(length, dt))
+    sn = np.clip(freq, cutfreq - 1e-9, cutfreq)
+    sn -= sn.min()
+    sn /= sn.max()
+    len_lpf = np.sum(np.ones_like(sn) - sn)
+    sn = gaussian_filter1d(sn, len_lpf / 6.0)
+    sn -= sn.min()
+    sn /= sn.max()
+    sn = 10.0 * (-sn + 1.0 + 1e-9)  # +1e-9 to prohibit 0/0 situations
+    regularizer = 1.0 / sn[: length // 2 + 1]
+    regularizer.flags.writeable = False
+    return regularizer
+
+
+UNIFORM_TOLERANCE = 0.01  # max deviation from a uniform timeline, in sample steps
+
+
+def resample(time, columns):
+    """Linear resampling of columns from time onto a uniform timeline.
+
+    The new timeline has as many samples as time, between its ends. The
+    lookup index and weights are computed once and shared by all columns.
+    If time is already uniform within UNIFORM_TOLERANCE the columns are
+    returned as they are. Returns the new time and the list of columns.
+    """
+    newtime = np.linspace(time[0], time[-1], len(time), dtype=np.float64)
+    step = (time[-1] - time[0]) / (len(time) - 1)
+    if np.max(np.abs(time - newtime)) <= UNIFORM_TOLERANCE * abs(step):
+        return newtime, [np.asarray(column, dtype=np.float64) for column in columns]
+
+    index = np.clip(np.searchsorted(time, newtime) - 1, 0, len(time) - 2)
+    weight = (newtime - time[index]) / (time[index + 1] - time[index])
+    resampled = []
+    for column in columns:
+        low = column[index]
+        resampled.append(low + (column[index + 1] - low) * weight)
+    return newtime, resampled
+
+
+def bin_index(values, low, high, bins):
+    ### bin of each value among bins equal bins over [low, high], as np.histogram2d
+    ### sorts them. values outside are at -1 or bins.
+    edges = np.linspace(low, high, bins + 1)
+    index = np.searchsorted(edges, values, side="right") - 1
+    index[values == edges[-1]] = bins - 1
+    return index
+
+
+class Hist2d:
+    """Running 2d histograms of rows of weights against x (0-100%) and y.
+
+    Every row of weights falls into a single x bin and every column into a
+    single y bin (y is ascending), so rows are summed per x bin as they are
+    added and columns per y bin at the end. count histograms with the same
+    x and y are kept at once, added as (count x row x column) weights.
+    See Trace.hist2d.
+    """
+
+    def __init__(self, y, bins, count=1):  # bins[nx,ny]
+        self.bins = bins
+        ybin = bin_index(y, y[0], y[-1], bins[1])
+        cols = np.flatnonzero((ybin >= 0) & (ybin < bins[1]))
+        self.cols = slice(cols[0], cols[-1] + 1)
+        self.ybin = ybin[cols]
+        self.xsums = np.zeros((count, bins[0], len(cols)), dtype=np.float64)
+
+    def add(self, x, weights):
+        xbin = bin_index(x, 0.0, 100.0, self.bins[0])
+        weights = weights.reshape((len(self.xsums),) + weights.shape[-2:])
+        weights = weights[..., self.cols]
+        for b in np.unique(xbin[(xbin >= 0) & (xbin < self.bins[0])]):
+            # rows go onto the running sum one after the other, as in a single
+            # sum over all rows, so the result does not depend on the blocks
+            rows = [self.xsums[:, b, np.newaxis], weights[:, xbin == b]]
+            self.xsums[:, b] = np.concatenate(rows, axis=1).sum(axis=1)
+
+    def result(self, x):
+        ### list of the hist2d dicts, x are all values added for the throttle histogram
+        throt_hist_avr, throt_scale_avr = np.histogram(x, 101, [0, 100])
+
+        hists = np.zeros(
+            (len(self.xsums), self.bins[1], self.bins[0]), dtype=np.float64
+        )
+        ybin = self.ybin
+        starts = np.flatnonzero(np.r_[True, ybin[1:] != ybin[:-1]])
+        if len(starts) == len(ybin):
+            hists[:, ybin] = self.xsums.transpose(0, 2, 1)  # one column per y bin
+        else:
+            hists[:, ybin[starts]] = np.add.reduceat(
+                self.xsums, starts, axis=2
+            ).transpose(0, 2, 1)
+
+        results = []
+        for hist2d in hists:
+            hist2d = np.array(abs(hist2d), dtype=np.float64)
+            hist2d_norm = np.copy(hist2d)
+            hist2d_norm /= throt_hist_avr + 1e-9
+            results.append(
+                {
+                    "hist2d_norm": hist2d_norm,
+                    "hist2d": hist2d,
+                    "throt_hist": throt_hist_avr,
+                    "throt_scale": throt_scale_avr,
+                }
+            )
+        return results
+
+
+def window_stack(trace, flen, superpos):
+    """Read-only (..., window x sample) view of overlapping windows over the last axis.
+
+    Windows are flen long and start every flen / superpos samples. Nothing
+    is copied, np.array(stack) gives an owned copy. trace has to stay
+    unchanged while the view is used.
+    """
+    tlen = trace.shape[-1]
+    shift = int(flen / superpos)
+    wins = max(min(int(tlen / shift) - superpos, (tlen - flen) // shift + 1), 0)
+    trace = np.ascontiguousarray(trace, dtype=np.float64)
+    stack = as_strided(
+        trace,
+        shape=trace.shape[:-1] + (wins, flen),
+        strides=trace.strides[:-1] + (shift * trace.strides[-1], trace.strides[-1]),
+    )
+    stack.flags.writeable = False
+    return stack
 
 
 class Trace:
@@ -13,20 +183,23 @@ class Trace:
     threshold = 500.0  # threshold for 'high input rate'
     noise_framelen = 0.3  # window width for noise analysis
     noise_superpos = 16  # subsampling for noise analysis windows
-
-    def __init__(self, data):
+    noise_freq_step = 4  # spectrum bins per frequency bin of the noise spectrograms
+    resp_range = [-1.5, 3.5]  # vertical range of the step response histograms
+    resp_bins = 1000  # vertical resolution of the step response histograms
+    chunk_windows = 256  # windows processed at once, bounds memory. None = all at once
+    resp_rate = None  # sample rate of the step response analysis in Hz. None = log rate
+    fft = fftbackend.NumpyFFT()  # see fftbackend.get_backend
+
+    def __init__(self, data, equalize=True, analyze=True):
+        ### equalize=False takes data as already equalized and with "input",
+        ### analyze=False leaves the stacks and their evaluation to the caller (see MultiTrace)
         self.data = data
-        self.input = self.equalize(
-            data["time"], self.pid_in(data["p_err"], data["gyro"], data["P"])
-        )[
-            1
-        ]  # /20.
-        self.data.update({"input": self.pid_in(data["p_err"], data["gyro"], data["P"])})
-        self.equalize_data()
+        if equalize:
+            self.data["input"] = self.pid_in(data["p_err"], data["gyro"], data["P"])
+            self.equalize_data()
 
         self.name = self.data["name"]
         self.time = self.data["time"]
-        self.dt = self.time[0] - self.time[1]
 
         self.input = self.data["input"]
         # enable this to generate artifical gyro trace with known system response
@@ -38,27 +211,51 @@ class Trace:
             self.throttle, np.linspace(0, 100, 101, dtype=np.float64), normed=True
         )
 
+        self.resp_data = self.response_data()  # step response input at resp_rate
+        resp_time = self.resp_data["time"]
+        self.dt = resp_time[0] - resp_time[1]  # sample time of the step response
         self.flen = self.stepcalc(
-            self.time, Trace.framelen
+            resp_time, self.framelen
         )  # array len corresponding to framelen in s
         self.rlen = self.stepcalc(
-            self.time, Trace.resplen
+            resp_time, self.resplen
         )  # array len corresponding to resplen in s
-        self.time_resp = self.time[0 : self.rlen] - self.time[0]
+        self.time_resp = resp_time[0 : self.rlen] - resp_time[0]
+        self.window = hann_window(self.flen)  # self.tukeywin(self.flen, self.tuk_alpha)
+        self.noise_winlen = self.stepcalc(self.time, self.noise_framelen)
+        self.noise_win = hann_window(self.noise_winlen)
 
+        if not analyze:
+            return
         self.stacks = self.winstacker(
             {"time": [], "input": [], "gyro": [], "throttle": []},
             self.flen,
-            Trace.superpos,
+            self.superpos,
+            self.resp_data,
         )  # [[time, input, output],]
-        self.window = np.hanning(self.flen)  # self.tukeywin(self.flen, self.tuk_alpha)
-        (
-            self.spec_sm,
-            self.avr_t,
-            self.avr_in,
-            self.max_in,
-            self.max_thr,
-        ) = self.stack_response(self.stacks, self.window)
+        self.eval_response(*self.stack_response(self.stacks, self.window))
+
+        self.noise_stack = self.winstacker(
+            {"time": [], "gyro": [], "throttle": [], "d_err": [], "debug": []},
+            self.noise_winlen,
+            self.noise_superpos,
+        )
+        self.eval_noise(
+            *self.stackspectrograms(
+                self.noise_stack["time"],
+                self.noise_stack["throttle"],
+                [self.noise_stack[key] for key in ("gyro", "d_err", "debug")],
+                self.noise_win,
+            )
+        )
+
+    def eval_response(self, spec_sm, avr_t, avr_in, max_in, max_thr):
+        ### evaluates the step responses of the windows, see stack_response
+        self.spec_sm = spec_sm
+        self.avr_t = avr_t
+        self.avr_in = avr_in
+        self.max_in = max_in
+        self.max_thr = max_thr
         self.low_mask, self.high_mask = self.low_high_mask(
             self.max_in, self.threshold
         )  # calcs masks for high and low inputs according to threshold
@@ -66,9 +263,15 @@ class Trace:
             1
         ]  # mask for ignoring noisy low input
 
-        self.resp_sm = self.weighted_mode_avr(
-            self.spec_sm, self.toolow_mask, [-1.5, 3.5], 1000
+        masks = [self.toolow_mask, self.low_mask * self.toolow_mask]
+        if self.high_mask.sum() > 0:
+            masks.append(self.high_mask * self.toolow_mask)
+        resps = self.weighted_mode_avrs(
+            self.spec_sm, masks, self.resp_range, self.resp_bins
         )
+        self.resp_sm, self.resp_low = resps[:2]
+        if len(resps) > 2:
+            self.resp_high = resps[2]
         self.resp_quality = (
             -self.to_mask(
                 (np.abs(self.spec_sm - self.resp_sm[0]).mean(axis=1)).clip(
@@ -81,44 +284,16 @@ class Trace:
         self.thr_response = self.hist2d(
             self.max_thr * (2.0 * (self.toolow_mask * self.resp_quality) - 1.0),
             self.time_resp,
-            (self.spec_sm.transpose() * self.toolow_mask).transpose(),
+            self.spec_sm,
             [101, self.rlen],
+            row_weights=self.toolow_mask,
         )
 
-        self.resp_low = self.weighted_mode_avr(
-            self.spec_sm, self.low_mask * self.toolow_mask, [-1.5, 3.5], 1000
-        )
-        if self.high_mask.sum() > 0:
-            self.resp_high = self.weighted_mode_avr(
-                self.spec_sm, self.high_mask * self.toolow_mask, [-1.5, 3.5], 1000
-            )
-
-        self.noise_winlen = self.stepcalc(self.time, Trace.noise_framelen)
-        self.noise_stack = self.winstacker(
-            {"time": [], "gyro": [], "throttle": [], "d_err": [], "debug": []},
-            self.noise_winlen,
-            Trace.noise_superpos,
-        )
-        self.noise_win = np.hanning(self.noise_winlen)
-
-        self.noise_gyro = self.stackspectrum(
-            self.noise_stack["time"],
-            self.noise_stack["throttle"],
-            self.noise_stack["gyro"],
-            self.noise_win,
-        )
-        self.noise_d = self.stackspectrum(
-            self.noise_stack["time"],
-            self.noise_stack["throttle"],
-            self.noise_stack["d_err"],
-            self.noise_win,
-        )
-        self.noise_debug = self.stackspectrum(
-            self.noise_stack["time"],
-            self.noise_stack["throttle"],
-            self.noise_stack["debug"],
-            self.noise_win,
-        )
+    def eval_noise(self, noise_gyro, noise_d, noise_debug):
+        ### takes the spectrograms of gyro, d_err and debug, see stackspectrum
+        self.noise_gyro = noise_gyro
+        self.noise_d = noise_d
+        self.noise_debug = noise_debug
         if self.noise_debug["hist2d"].sum() > 0:
             ## mask 0 entries
             thr_mask = self.noise_gyro["throt_hist_avr"].clip(0, 1)
@@ -146,7 +321,8 @@ class Trace:
         clipped /= clipped.max()
         return clipped
 
-    def pid_in(self, pval, gyro, pidp):
+    @staticmethod
+    def pid_in(pval, gyro, pidp):
         pidin = gyro + pval / (
             0.032029 * pidp
         )  # 0.032029 is P scaling factor from betaflight
@@ -220,18 +396,21 @@ class Trace:
 
     def equalize(self, time, data):
         ### equalizes time scale
-        data_f = interp1d(time, data)
-        newtime = np.linspace(time[0], time[-1], len(time), dtype=np.float64)
-        return newtime, data_f(newtime)
+        newtime, (data,) = resample(time, [data])
+        return newtime, data
 
     def equalize_data(self):
         ### equalizes full dict of data
         time = self.data["time"]
-        newtime = np.linspace(time[0], time[-1], len(time), dtype=np.float64)
-        for key in self.data:
-            if isinstance(self.data[key], np.ndarray):
-                if len(self.data[key]) == len(time):
-                    self.data[key] = interp1d(time, self.data[key])(newtime)
+        keys = [
+            key
+            for key, value in self.data.items()
+            if key != "time"
+            and isinstance(value, np.ndarray)
+            and len(value) == len(time)
+        ]
+        newtime, columns = resample(time, [self.data[key] for key in keys])
+        self.data.update(zip(keys, columns))
         self.data["time"] = newtime
 
     def stepcalc(self, time, duration):
@@ -241,64 +420,89 @@ class Trace:
         arr_len = duration * freq
         return int(arr_len)
 
-    def winstacker(self, stackdict, flen, superpos):
-        ### makes stack of windows for deconvolution
-        tlen = len(self.data["time"])
-        shift = int(flen / superpos)
-        wins = int(tlen / shift) - superpos
-        for i in np.arange(wins):
-            for key in stackdict.keys():
-                stackdict[key].append(self.data[key][i * shift : i * shift + flen])
-        for k in stackdict.keys():
-            # print 'key',k
-            # print stackdict[k]
-            stackdict[k] = np.array(stackdict[k], dtype=np.float64)
+    def winstacker(self, stackdict, flen, superpos, data=None):
+        ### makes stack of windows for deconvolution, from self.data by default
+        data = self.data if data is None else data
+        for key in stackdict.keys():
+            data[key] = np.ascontiguousarray(data[key], dtype=np.float64)
+            stackdict[key] = window_stack(data[key], flen, superpos)
         return stackdict
 
+    def response_data(self):
+        ### time, input, gyro and throttle for the step response. with resp_rate set,
+        ### input and gyro are low pass filtered (zero phase fir) and all are decimated
+        ### to about resp_rate. the noise analysis keeps the full rate.
+        ### at 1000Hz responses stay within about 0.02 of the full rate ones.
+        keys = ("time", "input", "gyro", "throttle")
+        factor = 1
+        if self.resp_rate:
+            rate = 1.0 / (self.time[1] - self.time[0])
+            factor = int(round(rate / self.resp_rate))
+        if factor < 2:
+            return {key: self.data[key] for key in keys}
+        return {
+            "time": self.time[::factor],
+            "throttle": self.throttle[::factor],
+            "input": decimate(self.input, factor, ftype="fir", zero_phase=True),
+            "gyro": decimate(self.gyro, factor, ftype="fir", zero_phase=True),
+        }
+
     def wiener_deconvolution(
         self, input, output, cutfreq
-    ):  # input/output are two-dimensional
-        pad = 1024 - (
-            len(input[0]) % 1024
-        )  # padding to power of 2, increases transform speed
-        input = np.pad(input, [[0, 0], [0, pad]], mode="constant")
-        output = np.pad(output, [[0, 0], [0, pad]], mode="constant")
-        H = np.fft.fft(input, axis=-1)
-        G = np.fft.fft(output, axis=-1)
-        freq = np.abs(np.fft.fftfreq(len(input[0]), self.dt))
-        sn = self.to_mask(np.clip(np.abs(freq), cutfreq - 1e-9, cutfreq))
-        len_lpf = np.sum(np.ones_like(sn) - sn)
-        sn = self.to_mask(gaussian_filter1d(sn, len_lpf / 6.0))
-        sn = 10.0 * (-sn + 1.0 + 1e-9)  # +1e-9 to prohibit 0/0 situations
+    ):  # input/output are (..., window, sample)
+        ### zero padding by up to 1024 samples is part of the estimate, more or less
+        ### changes the response. the padded length is rounded up to a fast fft length.
+        length = next_fast_len(input.shape[-1] + 1024 - input.shape[-1] % 1024)
+        H = self.fft.rfft(input, length, axis=-1)
+        G = self.fft.rfft(output, length, axis=-1)
+        regularizer = wiener_regularizer(length, nominal_dt(abs(self.dt)), cutfreq)
         Hcon = np.conj(H)
-        deconvolved_sm = np.real(np.fft.ifft(G * Hcon / (H * Hcon + 1.0 / sn), axis=-1))
+        deconvolved_sm = self.fft.irfft(
+            G * Hcon / (H * Hcon + regularizer), length, axis=-1
+        )
         return deconvolved_sm
 
     def stack_response(self, stacks, window):
-        inp = stacks["input"] * window
-        outp = stacks["gyro"] * window
-        thr = stacks["throttle"] * window
-
-        deconvolved_sm = self.wiener_deconvolution(inp, outp, self.cutfreq)[
-            :, : self.rlen
-        ]
-        delta_resp = deconvolved_sm.cumsum(axis=1)
-
-        max_thr = np.abs(np.abs(thr)).max(axis=1)
-        avr_in = np.abs(np.abs(inp)).mean(axis=1)
-        max_in = np.max(np.abs(inp), axis=1)
-        avr_t = stacks["time"].mean(axis=1)
+        ### stacks may carry leading axes, e.g. (axis x window x sample), see MultiTrace.
+        ### windows are deconvolved in blocks of chunk_windows.
+        wins = stacks["time"].shape[0]
+        shape = stacks["input"].shape[:-1]
+        delta_resp = np.empty(shape + (self.rlen,), dtype=np.float64)
+        avr_in = np.empty(shape, dtype=np.float64)
+        max_in = np.empty(shape, dtype=np.float64)
+        max_thr = np.empty(wins, dtype=np.float64)
+        avr_t = np.empty(wins, dtype=np.float64)
+
+        for block in self.blocks(wins):
+            inp = stacks["input"][..., block, :] * window
+            outp = stacks["gyro"][..., block, :] * window
+            thr = stacks["throttle"][block] * window
+
+            deconvolved_sm = self.wiener_deconvolution(inp, outp, self.cutfreq)[
+                ..., : self.rlen
+            ]
+            delta_resp[..., block, :] = deconvolved_sm.cumsum(axis=-1)
+
+            max_thr[block] = np.abs(np.abs(thr)).max(axis=-1)
+            avr_in[..., block] = np.abs(np.abs(inp)).mean(axis=-1)
+            max_in[..., block] = np.max(np.abs(inp), axis=-1)
+            avr_t[block] = stacks["time"][block].mean(axis=-1)
 
         return delta_resp, avr_t, avr_in, max_in, max_thr
 
+    def blocks(self, count):
+        ### slices over count windows, chunk_windows long
+        step = self.chunk_windows or max(count, 1)
+        return [slice(start, start + step) for start in range(0, count, step)]
+
     def spectrum(self, time, traces):
         ### fouriertransform for noise analysis. returns frequencies and spectrum.
         pad = 1024 - (
-            len(traces[0]) % 1024
+            traces.shape[-1] % 1024
         )  # padding to power of 2, increases transform speed
-        traces = np.pad(traces, [[0, 0], [0, pad]], mode="constant")
-        trspec = np.fft.rfft(traces, axis=-1, norm="ortho")
-        trfreq = np.fft.rfftfreq(len(traces[0]), time[1] - time[0])
+        length = traces.shape[-1] + pad  # zero padded by the transform
+        trspec = self.fft.rfft(traces, length, axis=-1, norm="ortho")
+        trfreq = rfft_freq(length, nominal_dt(time[1] - time[0]))
         return trfreq, trspec
 
     def stackfilter(self, time, trace_ref, trace_filt, window):
@@ -331,51 +535,54 @@ class Trace:
             bins=int(full_freq_r[-1]),
         )
 
-    def hist2d(self, x, y, weights, bins):  # bins[nx,ny]
-        ### generates a 2d hist from input 1d axis for x,y. repeats them to match shape of weights X*Y (data points)
-        ### x will be 0-100%
-        freqs = np.repeat(np.array([y], dtype=np.float64), len(x), axis=0)
-        throts = np.repeat(np.array([x], dtype=np.float64), len(y), axis=0).transpose()
-        throt_hist_avr, throt_scale_avr = np.histogram(x, 101, [0, 100])
-
-        hist2d = np.histogram2d(
-            throts.flatten(),
-            freqs.flatten(),
-            range=[[0, 100], [y[0], y[-1]]],
-            bins=bins,
-            weights=weights.flatten(),
-            normed=False,
-        )[0].transpose()
-
-        hist2d = np.array(abs(hist2d), dtype=np.float64)
-        hist2d_norm = np.copy(hist2d)
-        hist2d_norm /= throt_hist_avr + 1e-9
-
-        return {
-            "hist2d_norm": hist2d_norm,
-            "hist2d": hist2d,
-            "throt_hist": throt_hist_avr,
-            "throt_scale": throt_scale_avr,
-        }
+    def hist2d(self, x, y, weights, bins, row_weights=None):  # bins[nx,ny]
+        ### generates a 2d hist of weights (len(x) x len(y)) over the 1d axis x, y.
+        ### x will be 0-100%. rows of weights are scaled by row_weights, if given.
+        hist = Hist2d(y, bins)
+        for block in self.blocks(len(x)):
+            if row_weights is None:
+                hist.add(x[block], weights[block])
+            else:
+                hist.add(x[block], weights[block] * row_weights[block, np.newaxis])
+        return hist.result(x)[0]
 
     def stackspectrum(self, time, throttle, trace, window):
         ### calculates spectrogram from stack of windows against throttle.
-        # slicing off last 2s to get rid of landing
-        gyro = (
-            trace[: -int(Trace.noise_superpos * 2.0 / Trace.noise_framelen), :] * window
-        )
-        thr = (
-            throttle[: -int(Trace.noise_superpos * 2.0 / Trace.noise_framelen), :]
-            * window
-        )
-        time = time[: -int(Trace.noise_superpos * 2.0 / Trace.noise_framelen), :]
+        return self.stackspectrograms(time, throttle, [trace], window)[0]
 
-        freq, spec = self.spectrum(time[0], gyro)
+    def stackspectrograms(self, time, throttle, traces, window):
+        ### spectrograms of a list of stacks of windows against throttle, one per stack and
+        ### leading index of it, e.g. for [gyro, d_err] stacks of (axis x window x sample).
+        ### per block of chunk_windows all stacks are windowed and transformed together,
+        ### the throttle bins are found once and the histograms summed up block by block.
+        # slicing off last 2s to get rid of landing
+        cut = int(self.noise_superpos * 2.0 / self.noise_framelen)
+        traces = [
+            trace.reshape((-1,) + trace.shape[-2:])[:, :-cut, :] for trace in traces
+        ]
+        throttle = throttle[:-cut, :]
+        time = time[:-cut, :]
+
+        avr_thr = np.empty(len(time), dtype=np.float64)
+        hist = None
+        for block in self.blocks(len(time)):
+            thr = throttle[block] * window
+            avr_thr[block] = np.abs(thr).max(axis=1)
+
+            windowed = np.concatenate([trace[:, block] for trace in traces])
+            windowed *= window
+            freq, spec = self.spectrum(time[0], windowed)
+            weights = abs(spec.real)
+            if hist is None:
+                hist = Hist2d(
+                    freq, [101, len(freq) // self.noise_freq_step], len(weights)
+                )
+            hist.add(avr_thr[block], weights)
 
-        weights = abs(spec.real)
-        avr_thr = np.abs(thr).max(axis=1)
+        return [self.spectrogram(freq, hist2d) for hist2d in hist.result(avr_thr)]
 
-        hist2d = self.hist2d(avr_thr, freq, weights, [101, len(freq) // 4])
+    def spectrogram(self, freq, hist2d):
+        ### smoothed spectrogram from the hist2d of spectrum amplitudes against throttle
 
         filt_width = 3  # width of gaussian smoothing for hist data
         hist2d_sm = gaussian_filter1d(
@@ -384,13 +591,15 @@ class Trace:
 
         # get max value in histogram >100hz
         thresh = 100.0
-        mask = self.to_mask(freq[:-1:4].clip(thresh - 1e-9, thresh))
+        mask = self.to_mask(
+            freq[: -1 : self.noise_freq_step].clip(thresh - 1e-9, thresh)
+        )
         maxval = np.max(hist2d_sm.transpose() * mask)
 
         return {
             "throt_hist_avr": hist2d["throt_hist"],
             "throt_axis": hist2d["throt_scale"],
-            "freq_axis": freq[::4],
+            "freq_axis": freq[:: self.noise_freq_step],
             "hist2d_norm": hist2d["hist2d_norm"],
             "hist2d_sm": hist2d_sm,
             "hist2d": hist2d["hist2d"],
@@ -399,45 +608,259 @@ class Trace:
 
     def weighted_mode_avr(self, values, weights, vertrange, vertbins):
         ### finds the most common trace and std
+        return self.weighted_mode_avrs(values, [weights], vertrange, vertbins)[0]
+
+    def weighted_mode_avrs(self, values, masks, vertrange, vertbins):
+        ### finds the most common trace and std for each mask (weights of the windows).
+        ### values are binned once, the histograms of all masks are accumulated in
+        ### one bincount over the windows grouped by their mask weights.
         threshold = 0.5  # threshold for std calculation
-        filt_width = 7  # width of gaussian smoothing for hist data
+        filt_width = 7 * vertbins / 1000.0  # width of gaussian smoothing for hist data
 
         resp_y = np.linspace(vertrange[0], vertrange[-1], vertbins, dtype=np.float64)
-        times = np.repeat(
-            np.array([self.time_resp], dtype=np.float64), len(values), axis=0
-        )
-        weights = np.repeat(weights, len(values[0]))
-
-        hist2d = np.histogram2d(
-            times.flatten(),
-            values.flatten(),
-            range=[[self.time_resp[0], self.time_resp[-1]], vertrange],
-            bins=[len(times[0]), vertbins],
-            weights=weights.flatten(),
-        )[0].transpose()
+        rlen = len(self.time_resp)
+        nbins = vertbins * rlen
+
+        # windows with equal weights under every mask share a class
+        masks = np.array(masks, dtype=np.float64).reshape(-1, len(values))
+        order = np.lexsort(masks)
+        sorted_masks = masks[:, order]
+        first = np.r_[True, np.any(sorted_masks[:, 1:] != sorted_masks[:, :-1], axis=0)]
+        classes = np.empty(len(values), dtype=np.intp)
+        classes[order] = np.cumsum(first) - 1
+        class_weights = sorted_masks[:, first]
+
+        # flat (class, vertical bin, time bin) index, out of range values go to the last bin
+        xbin = bin_index(self.time_resp, self.time_resp[0], self.time_resp[-1], rlen)
+        counts = np.zeros(class_weights.shape[1] * nbins + 1, dtype=np.intp)
+        for block in self.blocks(len(values)):
+            flat = bin_index(values[block], vertrange[0], vertrange[-1], vertbins)
+            outside = (flat < 0) | (flat >= vertbins) | ((xbin < 0) | (xbin >= rlen))
+            flat *= rlen
+            flat += xbin
+            flat += (classes[block] * nbins)[:, np.newaxis]
+            flat[outside] = len(counts) - 1
+            counts += np.bincount(flat.ravel(), minlength=len(counts))
+        counts = counts[:-1].reshape(-1, vertbins, rlen)
+        hists = np.tensordot(class_weights, counts, axes=1)
         ### shift outer edges by +-1e-5 (10us) bacause of dtype32. Otherwise different precisions lead to artefacting.
         ### solution to this --> somethings strage here. In outer most edges some bins are doubled, some are empty.
         ### Hence sometimes produces "divide by 0 error" in "/=" operation.
 
-        if hist2d.sum():
-            hist2d_sm = gaussian_filter1d(hist2d, filt_width, axis=0, mode="constant")
-            hist2d_sm /= np.max(hist2d_sm, 0)
-
-            pixelpos = np.repeat(resp_y.reshape(len(resp_y), 1), len(times[0]), axis=1)
-            avr = np.average(pixelpos, 0, weights=hist2d_sm * hist2d_sm)
-        else:
-            hist2d_sm = hist2d
-            avr = np.zeros_like(self.time_resp)
+        filled = hists.sum(axis=(1, 2)) != 0
+        hists_sm = np.copy(hists)
+        avrs = np.zeros((len(hists), rlen), dtype=np.float64)
+        if filled.any():
+            hist2d_sm = gaussian_filter1d(
+                hists[filled], filt_width, axis=1, mode="constant"
+            )
+            hist2d_sm /= np.max(hist2d_sm, 1)[:, np.newaxis, :]
+            square = hist2d_sm * hist2d_sm
+            avrs[filled] = (resp_y[:, np.newaxis] * square).sum(axis=1) / square.sum(
+                axis=1
+            )
+            hists_sm[filled] = hist2d_sm
         # only used for monochrome error width
-        hist2d[hist2d <= threshold] = 0.0
-        hist2d[hist2d > threshold] = 0.5 / (vertbins / (vertrange[-1] - vertrange[0]))
+        hists[hists <= threshold] = 0.0
+        hists[hists > threshold] = 0.5 / (vertbins / (vertrange[-1] - vertrange[0]))
 
-        std = np.sum(hist2d, 0)
+        stds = np.sum(hists, 1)
 
-        return avr, std, [self.time_resp, resp_y, hist2d_sm]
+        return [
+            (avr, std, [self.time_resp, resp_y, hist2d_sm])
+            for avr, std, hist2d_sm in zip(avrs, stds, hists_sm)
+        ]
 
     ### calculates weighted avverage and resulting errors
     def weighted_avg_and_std(self, values, weights):
         average = np.average(values, axis=0, weights=weights)
         variance = np.average((values - average) ** 2, axis=0, weights=weights)
         return (average, np.sqrt(variance))
+
+
+class MultiTrace:
+    """Roll, pitch and yaw of one log, analysed together.
+
+    The axes share one equalization of their data and one window stack of
+    time and throttle. Their input, gyro and noise windows are stacked to
+    (axis x window x sample), so the deconvolution and every noise spectrum
+    run as one batched transform. ``traces`` holds a Trace with the
+    results of each axis, as used by the plotter. equalize=False takes
+    traces_data as returned by MultiTrace.equalize, trace_class is Trace or
+    a subclass with other settings, e.g. PreviewTrace.
+    """
+
+    def __init__(self, traces_data, equalize=True, trace_class=None):
+        if equalize:
+            traces_data = self.equalize(traces_data)
+        trace_class = trace_class or Trace
+        self.traces = [
+            trace_class(data, equalize=False, analyze=False) for data in traces_data
+        ]
+        ref = self.traces[0]
+
+        stacks = self.stacks(
+            "resp_data",
+            ["time", "throttle"],
+            ["input", "gyro"],
+            ref.flen,
+            ref.superpos,
+        )
+        spec_sm, avr_t, avr_in, max_in, max_thr = ref.stack_response(stacks, ref.window)
+        for i, trace in enumerate(self.traces):
+            trace.stacks = self.axis_stacks(stacks, i)
+            trace.eval_response(spec_sm[i], avr_t, avr_in[i], max_in[i], max_thr)
+
+        noise_stack = self.stacks(
+            "data",
+            ["time", "throttle"],
+            ["gyro", "d_err", "debug"],
+            ref.noise_winlen,
+            ref.noise_superpos,
+        )
+        noise = ref.stackspectrograms(
+            noise_stack["time"],
+            noise_stack["throttle"],
+            [noise_stack[key] for key in ("gyro", "d_err", "debug")],
+            ref.noise_win,
+        )
+        axes = len(self.traces)
+        for i, trace in enumerate(self.traces):
+            trace.noise_stack = self.axis_stacks(noise_stack, i)
+            trace.eval_noise(*noise[i::axes])
+
+    @staticmethod
+    def equalize(traces_data):
+        ### equalizes the time scale of all axes at once, arrays shared by
+        ### the axes (time, throttle) are only resampled once.
+        time = traces_data[0]["time"]
+        columns = {}
+        datas = []
+        for data in traces_data:
+            data = dict(data)
+            data["input"] = Trace.pid_in(data["p_err"], data["gyro"], data["P"])
+            for key, value in data.items():
+                if key != "time" and isinstance(value, np.ndarray):
+                    if len(value) == len(time):
+                        columns.setdefault(id(value), value)
+            datas.append(data)
+
+        newtime, equalized = resample(time, list(columns.values()))
+        rows = dict(zip(columns, equalized))
+        for data in datas:
+            for key, value in data.items():
+                if id(value) in rows:
+                    data[key] = rows[id(value)]
+            data["time"] = newtime
+        return datas
+
+    def stacks(self, source, shared, per_axis, flen, superpos):
+        ### window stacks of keys shared by all axes and (axis x window x sample)
+        ### stacks of per axis keys, from the source data dict of the traces
+        datas = [getattr(trace, source) for trace in self.traces]
+        stacks = {key: window_stack(datas[0][key], flen, superpos) for key in shared}
+        for key in per_axis:
+            stacks[key] = window_stack(
+                np.array([data[key] for data in datas]), flen, superpos
+            )
+        return stacks
+
+    @staticmethod
+    def axis_stacks(stacks, axis):
+        ### the stacks of one axis, as a Trace has them
+        return {
+            key: stack[axis] if stack.ndim == 3 else stack
+            for key, stack in stacks.items()
+        }
+
+
+class PreviewTrace(Trace):
+    """A Trace with coarse settings, for a quick first look at a log.
+
+    A quarter of the overlapping windows for the step response and noise,
+    a quarter of the vertical bins of the step response histograms and
+    noise spectrograms binned four times coarser in frequency. Settings
+    not overridden here follow Trace.
+    """
+
+    superpos = 4
+    noise_superpos = 4
+    resp_bins = 250
+    noise_freq_step = 16
+
+
+AXIS_MODES = ("batched", "threads", "processes")
+TRACE_CONFIG = (
+    "framelen",
+    "resplen",
+    "cutfreq",
+    "tuk_alpha",
+    "superpos",
+    "threshold",
+    "noise_framelen",
+    "noise_superpos",
+    "noise_freq_step",
+    "resp_range",
+    "resp_bins",
+    "chunk_windows",
+    "resp_rate",
+    "fft",
+)  # class attributes a worker process has to get from the parent
+
+
+def get_config():
+    return {key: getattr(Trace, key) for key in TRACE_CONFIG}
+
+
+def set_config(config):
+    for key, value in config.items():
+        setattr(Trace, key, value)
+
+
+def analyze_axis(data, config=None, trace_class=None):
+    ### one equalized axis as a Trace, config is applied in worker processes.
+    ### the window stacks are views of the data, pickling would copy them whole.
+    if config is not None:
+        set_config(config)
+    trace = (trace_class or Trace)(data, equalize=False)
+    if config is not None:
+        trace.stacks = trace.noise_stack = None
+    return trace
+
+
+def analyze_axes(
+    traces_data, mode="batched", workers=None, equalize=True, trace_class=None
+):
+    """Analyses the traces of one log, returns a Trace per axis in their order.
+
+    ``batched`` runs all axes as one MultiTrace. ``threads`` and ``processes``
+    equalize the axes together and then analyse each in its own worker
+    (``workers`` defaults to one per axis). Threads share the data and
+    suit the FFTs and ufuncs, which release the GIL. Processes also run
+    the Python level parts of the histograms in parallel, at the cost of
+    sending every axis and its results through a pipe; their Traces have
+    no window stacks. Results and log lines follow the axis order whatever
+    order the workers finish in. equalize=False takes traces_data as
+    returned by MultiTrace.equalize. trace_class, e.g. PreviewTrace, is the
+    Trace (sub)class analysing the axes.
+    """
+    if mode not in AXIS_MODES:
+        raise ValueError("Unknown axis mode %r, use one of %s" % (mode, AXIS_MODES))
+    if mode == "batched":
+        return MultiTrace(traces_data, equalize, trace_class).traces
+
+    datas = MultiTrace.equalize(traces_data) if equalize else traces_data
+    if mode == "threads":
+        executor, config = ThreadPoolExecutor, None
+    else:
+        executor = ProcessPoolExecutor
+        config = get_config()
+    with executor(workers or len(datas)) as pool:
+        futures = [
+            pool.submit(analyze_axis, data, config, trace_class) for data in datas
+        ]
+        traces = []
+        for future in futures:
+            traces.append(future.result())
+            logging.info("Analysed %s", traces[-1].name)
+    return traces
@@ -0,0 +1,522 @@
+import glob
+import json
+import logging
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from . import analyzer, cache, loader, plotter
+from .pipeline import QUEUE_SIZE, Failure, Pipeline, Stage
+
+### analysis of whole logs, one by one or as a batch over a process pool.
+
+LOG_EXTENSIONS = (".bbl", ".bfl")  # files picked up from directories
+BATCH_WORKERS = os.cpu_count() or 1  # processes analysing sessions at once
+STAGES = ("decode", "parse", "analyze", "render")  # of run_pipeline
+PROGRESS = ("decoded", "preview", "analysed", "rendered")  # events of a session
+PREVIEW_DPI = 40  # of the preview plots, 640 x 320 pixels
+
+
+def run_analysis(
+    log_file_path,
+    plot_name,
+    blackbox_decode,
+    show,
+    noise_bounds,
+    decode_workers=None,
+    decode_timeout=None,
+    stream=True,
+    cache=None,
+    axis_mode="batched",
+    axis_workers=None,
+    sessions=None,
+    decimate=True,
+    preview=False,
+    progress=None,
+    heads=None,
+):
+    # blackbox_decode=None decodes the sessions with the built-in decoder,
+    # stream=False has Blackbox_decode write csv files instead of piping them,
+    # axis_mode see analyzer.analyze_axes, sessions limits the analysis to these
+    # logNums, decimate see plot_session, preview see
+    # preview_session. progress(event, output) is called with the PROGRESS
+    # events of every session, log_progress by default. heads of sessions
+    # already indexed (see index_logs) are analysed without indexing the log
+    # again. returns the logNum and the plot paths of every analysed session
+    progress = progress or log_progress
+
+    tmp_dir = os.path.join(os.path.dirname(log_file_path), plot_name)
+    if not os.path.isdir(tmp_dir):
+        os.makedirs(tmp_dir)
+
+    if heads is None:
+        index = loader.SessionIndex(log_file_path)
+        heads = loader.beheader(index, tmp_dir)
+    else:
+        index = loader.SessionIndex(log_file_path, [head["session"] for head in heads])
+    if sessions is not None:
+        heads = [head for head in heads if head["logNum"] in sessions]
+    sessions = loader.readsessions(
+        index, heads, blackbox_decode, stream, decode_workers, decode_timeout, cache
+    )
+
+    outputs = []
+    for head, data in sessions:
+        logging.info("Reading: Log %s", head["logNum"])
+        if data is None:
+            continue
+        traces = loader.find_traces(data, head)
+        progress("decoded", plot_paths(head, plot_name))
+
+        logging.info("Processing:")
+        logging.info(", ".join(trace_data["name"] for trace_data in traces) + "...   ")
+        if preview:
+            traces = analyzer.MultiTrace.equalize(traces)
+            output = preview_session(
+                head,
+                traces,
+                plot_name,
+                noise_bounds,
+                axis_mode,
+                axis_workers,
+                decimate=decimate,
+            )
+            progress("preview", output)
+        axes = analyzer.analyze_axes(
+            traces, axis_mode, axis_workers, equalize=not preview
+        )
+        progress("analysed", plot_paths(head, plot_name))
+        output, _ = plot_session(
+            head, axes, plot_name, noise_bounds, show == "Y", decimate
+        )
+        progress("rendered", output)
+
+        outputs.append(output)
+        # nothing of a saved session is kept while the next one is decoded
+        del data, traces, axes
+
+    index.close()
+    logging.info("Analysis complete, showing plot. (Close plot to exit.)")
+    return outputs
+
+
+def plot_session(
+    head,
+    traces,
+    plot_name,
+    noise_bounds,
+    show=False,
+    decimate=True,
+    dpi=None,
+):
+    """Saves the response and noise plot of one session.
+
+    Returns their paths and the figures to show: show=True makes them
+    pyplot figures, otherwise every figure is cleared once it is saved
+    and none are returned, so no figure keeps the arrays of the session.
+    decimate draws the time traces of saved only plots per pixel column,
+    dpi overrides the resolution of the saved images.
+    """
+    fpath = head["tempFile"][:-3] + "01.csv"
+    output = plot_paths(head, plot_name)
+
+    fig_resp = plotter.plot_all_resp(
+        fpath,
+        head,
+        traces,
+        analyzer.Trace.threshold,
+        show=show,
+        decimate=decimate and not show,
+    )
+    logging.info("Saving response plot as image...")
+    save_figure(fig_resp, output["response"], dpi)
+    if not show:
+        fig_resp.clf()
+
+    fig_noise = plotter.plot_all_noise(
+        fpath,
+        head,
+        traces,
+        noise_bounds,
+        show,
+        decimate=decimate and not show,
+    )
+    logging.info("Saving noise plot as image...")
+    save_figure(fig_noise, output["noise"], dpi)
+    if not show:
+        fig_noise.clf()
+        return output, []
+    return output, [fig_resp, fig_noise]
+
+
+def preview_session(
+    head,
+    traces_data,
+    plot_name,
+    noise_bounds,
+    axis_mode="batched",
+    axis_workers=None,
+    **options,
+):
+    ### saves small plots of a coarse analysis (analyzer.PreviewTrace) of the
+    ### equalized traces_data, where the full plots of plot_session go later.
+    ### options are those of plot_session, returns the paths
+    traces = analyzer.analyze_axes(
+        traces_data,
+        axis_mode,
+        axis_workers,
+        equalize=False,
+        trace_class=analyzer.PreviewTrace,
+    )
+    output, _ = plot_session(
+        head, traces, plot_name, noise_bounds, dpi=PREVIEW_DPI, **options
+    )
+    return output
+
+
+def plot_paths(head, plot_name):
+    ### the logNum of a session and the paths of its response and noise plot
+    fpath = head["tempFile"][:-3] + "01.csv"
+    return {
+        "logNum": head["logNum"],
+        "response": f"{fpath[:-13]}.{plot_name}_{head['logNum']}_response.png",
+        "noise": f"{fpath[:-13]}.{plot_name}_{head['logNum']}_noise.png",
+    }
+
+
+def save_figure(fig, path, dpi=None):
+    ### written next to path and moved over it, so a plot replacing its preview
+    ### is never seen half written
+    part = path + ".part"
+    fig.savefig(part, format="png", dpi=dpi)
+    os.replace(part, path)
+
+
+def log_progress(event, output):
+    ### the default progress of run_analysis
+    if event in ("preview", "rendered"):
+        logging.info(
+            "Progress: log %s %s: %s, %s",
+            output["logNum"],
+            event,
+            output["response"],
+            output["noise"],
+        )
+    else:
+        logging.info("Progress: log %s %s", output["logNum"], event)
+
+
+def find_logs(paths):
+    """Expands files, glob patterns and directories to a sorted list of logs.
+
+    Directories contribute their files with one of LOG_EXTENSIONS, they
+    are not searched recursively.
+    """
+    logs = set()
+    for path in paths:
+        path = os.path.abspath(os.path.expanduser(path))
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                if name.lower().endswith(LOG_EXTENSIONS):
+                    logs.add(os.path.join(path, name))
+        elif glob.has_magic(path):
+            logs.update(p for p in glob.glob(path) if os.path.isfile(p))
+        else:
+            logs.add(path)
+    return sorted(logs)
+
+
+def init_worker(config, level):
+    ### worker processes don't inherit the class configuration when spawned
+    logging.basicConfig(
+        format="%(levelname)s %(asctime)s %(filename)s:%(lineno)s: %(message)s",
+        level=level,
+    )
+    analyzer.set_config(config)
+
+
+def run_session(log_path, head, settings):
+    ### analyses one session, head as index_logs found it, in a worker process.
+    ### returns its summary entry
+    start = time.time()
+    entry = {"logNum": head["logNum"], "status": "failed"}
+    try:
+        cache_dir = settings.pop("cache_dir")
+        session_cache = None if cache_dir is None else cache.SessionCache(cache_dir)
+        outputs = run_analysis(
+            log_path, show="N", cache=session_cache, heads=[head], **settings
+        )
+        if outputs:
+            entry.update(outputs[0], status="ok")
+        else:
+            entry["error"] = "session could not be decoded"
+    except Exception as error:
+        entry["error"] = "".join(traceback.format_exception_only(type(error), error))
+        entry["error"] = entry["error"].strip()
+    entry["seconds"] = round(time.time() - start, 3)
+    return entry
+
+
+def run_batch(log_paths, settings, workers=None, summary_path=None):
+    """Analyses every session of many logs in a pool of worker processes.
+
+    ``settings`` are the keyword arguments of run_analysis for every log,
+    with ``cache_dir`` (None = no cache) in place of ``cache``. A failing
+    session, or a worker process dying on it, only fails that session. The
+    summary of all logs (status, seconds, plot paths and errors per
+    session) is returned and, given ``summary_path``, written there as json.
+    """
+    start = time.time()
+    workers = workers or BATCH_WORKERS
+    logs, tasks, heads = index_logs(log_paths, settings["plot_name"])
+    logging.info(
+        "Batch: %d sessions of %d logs on %d processes", len(tasks), len(logs), workers
+    )
+
+    init = (analyzer.get_config(), logging.getLogger().level)
+    results = {}
+    pending = deque(tasks)
+    suspects = []
+    while pending:
+        # a dying worker breaks the whole pool, the sessions left go on in a
+        # new one and those in flight then are suspects
+        for task, entry in run_pool(logs, heads, pending, settings, workers, init):
+            if entry is None:
+                suspects.append(task)
+                continue
+            results[task] = entry
+            logging.info(
+                "Batch: %s log %s %s (%d/%d)",
+                os.path.basename(logs[task[0]]["log"]),
+                entry["logNum"],
+                entry["status"],
+                len(results),
+                len(tasks),
+            )
+    # suspects are rerun one by one, so only the session killing its worker fails
+    for task in sorted(suspects):
+        [(_, entry)] = run_pool(logs, heads, deque([task]), settings, 1, init)
+        results[task] = entry or {
+            "logNum": task[1],
+            "status": "failed",
+            "error": "worker process died",
+        }
+
+    summary = {"workers": workers, "logs": summarize(logs, tasks, results)}
+    summary["seconds"] = round(time.time() - start, 3)
+    write_summary(summary, summary_path)
+    return summary
+
+
+def run_pool(logs, heads, tasks, settings, workers, init):
+    ### runs the (log, session) tasks on a new pool, taking them from the
+    ### deque with only ``workers`` submitted at once, so all are on a worker.
+    ### yields (task, summary entry) of each finished session. a dying worker
+    ### ends the pool, the sessions then in flight are yielded with entry
+    ### None and those not submitted are left in the deque.
+    running = {}
+    broken = False
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=init) as pool:
+        while not broken and (tasks or running):
+            while tasks and len(running) < workers:
+                i, lognum = task = tasks.popleft()
+                try:
+                    future = pool.submit(
+                        run_session, logs[i]["log"], heads[task], dict(settings)
+                    )
+                except BrokenProcessPool:
+                    tasks.appendleft(task)
+                    broken = True
+                    break
+                running[future] = task
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                if isinstance(future.exception(), BrokenProcessPool):
+                    broken = True
+                else:
+                    yield running.pop(future), future.result()
+    for future, task in running.items():
+        if future.exception() is None:
+            yield task, future.result()
+        else:
+            yield task, None
+
+
+def index_logs(log_paths, plot_name):
+    ### the summary entry of every log, a (log, logNum) task per session and
+    ### the head of every task. each log is indexed and its headers are parsed
+    ### once here, the sessions are analysed from their heads
+    logs = []
+    tasks = []
+    heads = {}
+    for log_path in log_paths:
+        log = {"log": log_path, "status": "ok", "sessions": []}
+        try:
+            tmp_dir = os.path.join(os.path.dirname(log_path), plot_name)
+            os.makedirs(tmp_dir, exist_ok=True)
+            with loader.SessionIndex(log_path) as index:
+                log_heads = loader.beheader(index, tmp_dir)
+        except (OSError, ValueError) as error:
+            log.update(status="failed", error=str(error))
+            log_heads = []
+        logs.append(log)
+        for head in log_heads:
+            task = len(logs) - 1, head["logNum"]
+            tasks.append(task)
+            heads[task] = head
+    return logs, tasks, heads
+
+
+def summarize(logs, tasks, results):
+    ### adds the session results to their logs and sets the status of the logs
+    for i, lognum in tasks:
+        logs[i]["sessions"].append(results[i, lognum])
+    for log in logs:
+        if log["status"] == "failed":
+            continue
+        states = {entry["status"] for entry in log["sessions"]}
+        if not states:
+            log["status"] = "empty"
+        elif states != {"ok"}:
+            log["status"] = "failed" if states == {"failed"} else "partial"
+        log["seconds"] = round(sum(e.get("seconds", 0) for e in log["sessions"]), 3)
+    return logs
+
+
+def write_summary(summary, summary_path):
+    if summary_path is not None:
+        with open(summary_path, "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        logging.info("Batch summary written to %s", summary_path)
+
+
+def run_pipeline(
+    log_paths, settings, stage_workers=None, queue_size=QUEUE_SIZE, summary_path=None
+):
+    """Analyses every session of many logs in overlapping stages.
+
+    Sessions go through decode (Blackbox_decode or the built-in decoder,
+    or the cache), parse (traces of the axes, equalized), analyze and
+    render, each stage in its own threads (``stage_workers`` maps stage
+    names to their number, default 1) with ``queue_size`` sessions
+    waiting in front of it. So while one session renders the next ones
+    are analysed and decoded, and a slow stage holds the earlier ones back
+    instead of piling up decoded sessions. ``settings`` and the returned
+    summary are as for run_batch, the summary also has the utilization of
+    every stage. Plots are rendered with Agg, they are not shown, and
+    several sessions can render at once.
+    """
+    start = time.time()
+    stage_workers = dict(dict.fromkeys(STAGES, 1), **(stage_workers or {}))
+    settings = dict(settings)
+    cache_dir = settings.pop("cache_dir", None)
+    session_cache = None if cache_dir is None else cache.SessionCache(cache_dir)
+    logs, tasks, heads = index_logs(log_paths, settings["plot_name"])
+
+    def timed(name, func):
+        def run(job):
+            started = time.time()
+            job = func(job)
+            job["seconds"][name] = round(time.time() - started, 3)
+            return job
+
+        return run
+
+    def decode(session):
+        ### a session comes as its log and head from index_logs, only its
+        ### offsets in the log are mapped
+        log_path, head = session
+        with loader.SessionIndex(log_path, [head["session"]]) as index:
+            [(head, data)] = loader.readsessions(
+                index,
+                [head],
+                settings.get("blackbox_decode"),
+                settings.get("stream", True),
+                settings.get("decode_workers"),
+                settings.get("decode_timeout"),
+                session_cache,
+            )
+        if data is None:
+            raise ValueError("session could not be decoded")
+        log_progress("decoded", plot_paths(head, settings["plot_name"]))
+        return {"head": head, "data": data, "seconds": {}}
+
+    def parse(job):
+        traces = loader.find_traces(job.pop("data"), job["head"])
+        job["traces"] = analyzer.MultiTrace.equalize(traces)
+        return job
+
+    def analyze(job):
+        if settings.get("preview"):
+            output = preview_session(
+                job["head"],
+                job["traces"],
+                settings["plot_name"],
+                settings["noise_bounds"],
+                settings.get("axis_mode", "batched"),
+                settings.get("axis_workers"),
+                decimate=settings.get("decimate", True),
+            )
+            log_progress("preview", output)
+        job["traces"] = analyzer.analyze_axes(
+            job["traces"],
+            settings.get("axis_mode", "batched"),
+            settings.get("axis_workers"),
+            equalize=False,
+        )
+        log_progress("analysed", plot_paths(job["head"], settings["plot_name"]))
+        return job
+
+    def render(job):
+        job["output"], _ = plot_session(
+            job["head"],
+            job.pop("traces"),
+            settings["plot_name"],
+            settings["noise_bounds"],
+            decimate=settings.get("decimate", True),
+        )
+        log_progress("rendered", job["output"])
+        return job
+
+    funcs = {"decode": decode, "parse": parse, "analyze": analyze, "render": render}
+    pipeline = Pipeline(
+        [
+            Stage(name, timed(name, funcs[name]), stage_workers[name], queue_size)
+            for name in STAGES
+        ]
+    )
+    logging.info(
+        "Pipeline: %d sessions of %d logs, workers %s",
+        len(tasks),
+        len(logs),
+        ", ".join(f"{name} {stage_workers[name]}" for name in STAGES),
+    )
+    results = {}
+    sessions = [(logs[task[0]]["log"], heads[task]) for task in tasks]
+    for number, job in pipeline.run(sessions):
+        i, lognum = tasks[number]
+        if isinstance(job, Failure):
+            entry = {"logNum": lognum, "status": "failed", "error": str(job)}
+        else:
+            entry = dict(job["output"], status="ok", stages=job["seconds"])
+            entry["seconds"] = round(sum(job["seconds"].values()), 3)
+        results[i, lognum] = entry
+        logging.info(
+            "Pipeline: %s log %s %s (%d/%d)",
+            os.path.basename(logs[i]["log"]),
+            lognum,
+            entry["status"],
+            len(results),
+            len(tasks),
+        )
+
+    summary = {
+        "stages": pipeline.report(),
+        "logs": summarize(logs, tasks, results),
+        "seconds": round(time.time() - start, 3),
+    }
+    write_summary(summary, summary_path)
+    return summary
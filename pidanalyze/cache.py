@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+
+### on-disk cache of decoded sessions, keyed by the hash of their raw bytes and
+### the decoder that decoded them. every entry is a directory with one .npy file
+### per column (loaded memory-mapped) and a header.json with the decoder and the
+### column names.
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "PID-Analyzer")
+CACHE_MAX_BYTES = 2 << 30
+CACHE_VERSION = "2"  # bump when the cached data dict changes
+
+
+class SessionCache:
+    def __init__(self, path=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, buf, offset, length, decoder, blocksize=1 << 24):
+        ### decoder names the decoder and its version, see loader.decoder_id
+        digest = hashlib.sha256(f"{CACHE_VERSION}\0{decoder}\0".encode())
+        with memoryview(buf) as view:
+            for start in range(offset, offset + length, blocksize):
+                with view[start : min(start + blocksize, offset + length)] as block:
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def load(self, key, decoder):
+        ### returns the cached data dict or None, also if decoder did not make it
+        entry = os.path.join(self.path, key)
+        try:
+            with open(os.path.join(entry, "header.json")) as header_file:
+                header = json.load(header_file)
+            if header["decoder"] != decoder:
+                logging.warning("Cached session %s is of another decoder", key[:12])
+                return None
+            data = {
+                name: np.load(os.path.join(entry, f"col{i}.npy"), mmap_mode="r")
+                for i, name in enumerate(header["columns"])
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+        # last use decides eviction order
+        os.utime(os.path.join(entry, "header.json"))
+        logging.info("Using cached session %s", key[:12])
+        return data
+
+    def store(self, key, data, decoder):
+        entry = os.path.join(self.path, key)
+        tmp_entry = f"{entry}.tmp{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_entry)
+        try:
+            columns = list(data)
+            for i, name in enumerate(columns):
+                np.save(os.path.join(tmp_entry, f"col{i}.npy"), data[name])
+            with open(os.path.join(tmp_entry, "header.json"), "w") as header_file:
+                json.dump({"decoder": decoder, "columns": columns}, header_file)
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # already stored by someone else, or disk trouble: just don't cache
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self):
+        ### drops least recently used entries until the cache fits max_bytes
+        with self.lock:
+            entries = []
+            total = 0
+            for key in os.listdir(self.path):
+                entry = os.path.join(self.path, key)
+                try:
+                    size = sum(
+                        os.path.getsize(os.path.join(entry, name))
+                        for name in os.listdir(entry)
+                    )
+                    used = os.path.getmtime(os.path.join(entry, "header.json"))
+                except OSError:
+                    continue
+                entries.append((used, size, entry))
+                total += size
+            for used, size, entry in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
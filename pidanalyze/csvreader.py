@@ -0,0 +1,112 @@
+import io
+import mmap
+import os
+
+import numpy as np
+
+### readers for the csv written by blackbox_decode. the columns are parsed by the C
+### parser of pandas if it is installed, it is only imported with the first csv.
+### without it np.loadtxt is used, a Python loop before numpy 1.23, many times slower.
+
+CSV_CHUNK_BYTES = 1 << 22  # csv bytes parsed per chunk
+
+
+class ColumnBuffer:
+    ### preallocated columns that double their capacity when full
+    def __init__(self, names, dtype=np.float64, capacity=1 << 16):
+        self.names = names
+        self.size = 0
+        self.table = np.empty((len(names), capacity), dtype=dtype)
+
+    def append(self, rows):
+        ### rows is (n, len(names)) as returned by parse_lines
+        n = len(rows)
+        if self.size + n > self.table.shape[1]:
+            capacity = max(2 * self.table.shape[1], self.size + n)
+            table = np.empty((len(self.names), capacity), dtype=self.table.dtype)
+            table[:, : self.size] = self.table[:, : self.size]
+            self.table = table
+        self.table[:, self.size : self.size + n] = rows.T
+        self.size += n
+
+    def columns(self):
+        return {name: self.table[i, : self.size] for i, name in enumerate(self.names)}
+
+
+def header_columns(header_line, wanted):
+    ### returns the wanted column names and their positions in the csv
+    names = [name.strip() for name in header_line.decode("latin-1").split(",")]
+    usecols = [i for i, name in enumerate(names) if name in wanted]
+    return [names[i] for i in usecols], usecols
+
+
+def parse_lines(block, usecols, dtype=np.float64):
+    ### parses a bytes block of complete csv lines, only the columns in usecols
+    try:
+        from pandas import read_csv
+    except ImportError:
+        return np.loadtxt(
+            block.splitlines(), delimiter=",", usecols=usecols, dtype=dtype, ndmin=2
+        )
+    return read_csv(
+        io.BytesIO(block),
+        header=None,
+        usecols=usecols,
+        dtype=dtype,
+        skipinitialspace=True,
+    ).values
+
+
+def read_stream(stream, wanted, dtype=np.float64, blocksize=1 << 20):
+    """Reads a blackbox csv from a binary stream block by block.
+
+    Only the ``wanted`` columns are parsed, into growing arrays, so the
+    csv never has to be held in memory or written to disk.
+    """
+    names, usecols = header_columns(stream.readline(), wanted)
+    buffer = ColumnBuffer(names, dtype)
+    while True:
+        lines = stream.readlines(blocksize)
+        if not lines:
+            break
+        buffer.append(parse_lines(b"".join(lines), usecols, dtype))
+    return buffer.columns()
+
+
+def split_chunks(buf, start, chunksize):
+    ### (start, end) byte ranges of buf that each end on a newline
+    chunks = []
+    while start < len(buf):
+        end = buf.find(b"\n", min(start + chunksize, len(buf)) - 1)
+        end = len(buf) if end < 0 else end + 1
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def iter_csv(fpath, wanted, dtype=np.float64, chunksize=CSV_CHUNK_BYTES):
+    """Yields the ``wanted`` columns of a blackbox csv file chunk by chunk.
+
+    Every chunk is a dict of column name -> array with the rows of about
+    ``chunksize`` bytes of the file, in file order. The header is resolved
+    once, a chunk is only parsed when the consumer asks for it.
+    """
+    with open(fpath, "rb") as csv_file:
+        if not os.fstat(csv_file.fileno()).st_size:
+            return
+        with mmap.mmap(csv_file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header_end = buf.find(b"\n") + 1 or len(buf)
+            names, usecols = header_columns(buf[:header_end], wanted)
+            for start, end in split_chunks(buf, header_end, chunksize):
+                rows = parse_lines(buf[start:end], usecols, dtype)
+                yield {name: rows[:, i] for i, name in enumerate(names)}
+
+
+def read_csv(fpath, wanted, dtype=np.float64, chunksize=CSV_CHUNK_BYTES):
+    """Reads the ``wanted`` columns of a blackbox csv file into contiguous arrays."""
+    chunks = list(iter_csv(fpath, wanted, dtype, chunksize))
+    if not chunks:
+        return {}
+    return {
+        name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]
+    }
@@ -0,0 +1,721 @@
+import logging
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+### native reader for the blackbox binary log format (one session at a time).
+### follows the frame layout of blackbox-tools' parser.c: a block of "H name:value"
+### header lines is followed by I (intra), P (inter), E (event), S (slow), G (gps) and
+### H (gps home) frames. only I/P main frames are kept, everything else is skipped.
+### with numba installed the frame loop is compiled and releases the GIL, without
+### it the same functions run as plain Python, many times slower.
+
+ENCODING_SIGNED_VB = 0
+ENCODING_UNSIGNED_VB = 1
+ENCODING_NEG_14BIT = 3
+ENCODING_TAG8_8SVB = 6
+ENCODING_TAG2_3S32 = 7
+ENCODING_TAG8_4S16 = 8
+ENCODING_NULL = 9
+ENCODING_TAG2_3SVARIABLE = 10
+
+PREDICT_0 = 0
+PREDICT_PREVIOUS = 1
+PREDICT_STRAIGHT_LINE = 2
+PREDICT_AVERAGE_2 = 3
+PREDICT_MINTHROTTLE = 4
+PREDICT_MOTOR_0 = 5
+PREDICT_INC = 6
+PREDICT_HOME_COORD = 7
+PREDICT_1500 = 8
+PREDICT_VBATREF = 9
+PREDICT_LAST_MAIN_FRAME_TIME = 10
+PREDICT_MINMOTOR = 11
+
+EVENT_SYNC_BEEP = 0
+EVENT_AUTOTUNE_CYCLE_START = 10
+EVENT_AUTOTUNE_CYCLE_RESULT = 11
+EVENT_AUTOTUNE_TARGETS = 12
+EVENT_INFLIGHT_ADJUSTMENT = 13
+EVENT_LOGGING_RESUME = 14
+EVENT_DISARM = 15
+EVENT_GTUNE_CYCLE_RESULT = 20
+EVENT_FLIGHTMODE = 30
+EVENT_LOG_END = 255
+
+FRAME_TYPES = b"IPESGH"
+FIELD_FRAMES = "IPSGH"  # frame types with fields, their index is the frame kind
+KIND_EVENT = len(FIELD_FRAMES)
+KIND_UNDEFINED = -1  # frame type without fields in the header
+KIND_NONE = -2  # byte starting no frame
+MAX_FRAME_LENGTH = 256
+MAX_ITERATION_JUMP = 500 * 10
+MAX_TIME_JUMP = 10 * 1000000
+LOG_END_MARKER = np.frombuffer(b"End of log\x00", dtype=np.uint8)
+
+VERSION = "2"  # bump when decoded values change, cached sessions are dropped
+
+### blackbox_decode renames some fields in its csv header
+CSV_NAMES = {"time": "time (us)"}
+
+COMPILED = numba is not None
+if COMPILED:
+    compiled = numba.njit(cache=True, nogil=True)
+else:
+
+    def compiled(func):
+        return func
+
+
+class DecodeError(ValueError):
+    pass
+
+
+def parse_header(buf, start=0, end=None):
+    ### reads the "H name:value" lines at the start of a session.
+    ### returns the raw values by name and the offset of the first frame.
+    end = len(buf) if end is None else end
+    header = {}
+    pos = start
+    while pos < end - 1 and buf[pos : pos + 2] == b"H ":
+        newline = buf.find(b"\n", pos, end)
+        if newline < 0:
+            newline = end
+        line = bytes(buf[pos + 2 : newline]).decode("latin-1").rstrip("\r")
+        name, _, value = line.partition(":")
+        header[name] = value
+        pos = newline + 1
+    return header, pos
+
+
+@compiled
+def sign_extend(value, bits):
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
+
+
+class FrameDef:
+    ### field layout of one frame type, compiled to decoding steps: rows of
+    ### (encoding, first field, fields) and of (field, predictor) for the
+    ### predicted fields, and 1 for every signed field, 0 for unsigned
+    def __init__(self, names, predictors, encodings, signed):
+        self.names = names
+        self.count = len(encodings)
+        self.signed = np.zeros(self.count, dtype=np.int64)
+        self.signed[: len(signed)] = signed[: self.count]
+        self.predictors = np.array(
+            [(i, p) for i, p in enumerate(predictors[: self.count]) if p != PREDICT_0],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        steps = []
+        i = 0
+        while i < self.count:
+            enc = encodings[i]
+            if enc == ENCODING_TAG8_8SVB:
+                n = 1
+                while n < 8 and i + n < self.count and encodings[i + n] == enc:
+                    n += 1
+            elif enc in (ENCODING_TAG2_3S32, ENCODING_TAG2_3SVARIABLE):
+                n = 3
+            elif enc == ENCODING_TAG8_4S16:
+                n = 4
+            elif enc in (
+                ENCODING_SIGNED_VB,
+                ENCODING_UNSIGNED_VB,
+                ENCODING_NEG_14BIT,
+                ENCODING_NULL,
+            ):
+                n = 1
+            else:
+                raise DecodeError("Unsupported field encoding %d." % enc)
+            steps.append((enc, i, n))
+            i += n
+        self.steps = np.array(steps, dtype=np.int64).reshape(-1, 3)
+
+
+def header_ints(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def frame_defs(header):
+    ### builds FrameDefs from the "Field X ..." header lines.
+    defs = {}
+    main_names = header.get("Field I name", "").split(",")
+    for ftype in FIELD_FRAMES:
+        if f"Field {ftype} encoding" not in header:
+            continue
+        if ftype in "IP":
+            ### P frames have the names and signedness of I frames
+            names = main_names
+            signed = header.get("Field I signed", "")
+        else:
+            names = header.get(f"Field {ftype} name", "").split(",")
+            signed = header.get(f"Field {ftype} signed", "")
+        defs[ftype] = FrameDef(
+            names,
+            header_ints(header.get(f"Field {ftype} predictor", "")),
+            header_ints(header[f"Field {ftype} encoding"]),
+            header_ints(signed),
+        )
+    if "I" not in defs or "P" not in defs:
+        raise DecodeError("Log header has no main frame definition.")
+    return defs
+
+
+def frame_intervals(header):
+    ### returns (I interval, P numerator, P denominator)
+    i_interval = max(int(header.get("I interval", "32")), 1)
+    p_interval = header.get("P interval", "1/1")
+    if "/" in p_interval:
+        num, denom = p_interval.split("/")
+        p_num, p_denom = int(num), int(denom)
+    else:
+        p_num, p_denom = 1, int(p_interval)
+    return i_interval, max(p_num, 1), max(p_denom, 1)
+
+
+def frame_tables(defs):
+    ### the frame kind every byte starts, and the steps and predictors of all
+    ### FrameDefs concatenated, with the (start, stop) rows of each kind
+    kinds = np.full(256, KIND_NONE, dtype=np.int64)
+    for ftype in FRAME_TYPES:
+        kinds[ftype] = KIND_UNDEFINED
+    kinds[ord("E")] = KIND_EVENT
+    tables = {"steps": [], "predictors": []}
+    bounds = {name: np.zeros((len(FIELD_FRAMES), 2), np.int64) for name in tables}
+    for kind, ftype in enumerate(FIELD_FRAMES):
+        if ftype not in defs:
+            continue
+        kinds[ord(ftype)] = kind
+        for name, rows in tables.items():
+            start = sum(len(table) for table in rows)
+            rows.append(getattr(defs[ftype], name))
+            bounds[name][kind] = start, start + len(rows[-1])
+    return (
+        kinds,
+        np.concatenate(tables["steps"]),
+        bounds["steps"],
+        np.concatenate(tables["predictors"]),
+        bounds["predictors"],
+    )
+
+
+def decode_session(buf, start=0, end=None, wanted=None):
+    """Decodes the main frames of one BBL session.
+
+    Returns a dict of float64 columns named like the csv header of
+    blackbox_decode, restricted to ``wanted`` if given.
+    """
+    end = len(buf) if end is None else end
+    header, pos = parse_header(buf, start, end)
+    defs = frame_defs(header)
+    i_interval, p_num, p_denom = frame_intervals(header)
+
+    main_names = defs["I"].names
+    csv_names = [CSV_NAMES.get(n, n) for n in main_names]
+    keep = [i for i, n in enumerate(csv_names) if wanted is None or n in wanted]
+    if "loopIteration" not in main_names or "time" not in main_names or not keep:
+        raise DecodeError("Log has no loopIteration/time fields.")
+    params = np.array(
+        [
+            int(header.get("Data version", "2")),
+            i_interval,
+            p_num,
+            p_denom,
+            int(header.get("minthrottle", "1150")),
+            int(header.get("vbatref", "4095")),
+            header_ints(header.get("motorOutput", "0"))[0],
+            main_names.index("loopIteration"),
+            main_names.index("time"),
+            main_names.index("motor[0]") if "motor[0]" in main_names else 0,
+            max(fdef.count for fdef in defs.values()) + 8,  # values of a frame
+        ],
+        dtype=np.int64,
+    )
+
+    tables = frame_tables(defs) + (
+        defs["I"].signed,
+        np.array(keep, dtype=np.int64),
+        params,
+    )
+    ### current, previous, previous2 and other frame values, and the error flag
+    values = np.zeros((4, params[-1]), dtype=np.int64)
+    err = np.zeros(1, dtype=np.int64)
+    view = memoryview(buf)[pos:end]  # into the mmap of the log, not a copy
+    if COMPILED:
+        view = np.frombuffer(view, dtype=np.uint8)
+    else:
+        ### plain ints are much faster than numpy scalars in the Python loop
+        tables = [table.tolist() for table in tables]
+        values, err = values.tolist(), err.tolist()
+    table, corrupt = decode_frames(view, *tables, values, err)
+    del view
+    if corrupt:
+        logging.warning("Skipped %d corrupt frames while decoding.", corrupt)
+
+    return {
+        csv_names[i]: np.array(table[:, j], dtype=np.float64)
+        for j, i in enumerate(keep)
+    }
+
+
+### the frame loop. buf is the session after its header, a uint8 array when
+### compiled, else a memoryview. bytes past its end read as 0, a frame running
+### over the end shows as pos > size. errors set err[0], the frame is corrupt.
+
+
+@compiled
+def read_byte(buf, pos, size):
+    if pos < size:
+        return int(buf[pos])
+    return 0
+
+
+@compiled
+def read_unsigned_vb(buf, pos, size, err):
+    result = 0
+    shift = 0
+    for _ in range(5):
+        b = read_byte(buf, pos, size)
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+    err[0] = 1  # variable byte too long
+    return result, pos
+
+
+@compiled
+def read_signed_vb(buf, pos, size, err):
+    u, pos = read_unsigned_vb(buf, pos, size, err)
+    return (u >> 1) ^ -(u & 1), pos
+
+
+@compiled
+def read_s16(buf, pos, size):
+    v = read_byte(buf, pos, size) | (read_byte(buf, pos + 1, size) << 8)
+    return sign_extend(v, 16), pos + 2
+
+
+@compiled
+def read_tag8_8svb(buf, pos, size, err, values, i, n):
+    if n == 1:
+        values[i], pos = read_signed_vb(buf, pos, size, err)
+        return pos
+    header_byte = read_byte(buf, pos, size)
+    pos += 1
+    for j in range(n):
+        if header_byte & 1:
+            values[i + j], pos = read_signed_vb(buf, pos, size, err)
+        else:
+            values[i + j] = 0
+        header_byte >>= 1
+    return pos
+
+
+@compiled
+def read_whole_bytes(buf, pos, size, values, i, selector):
+    for j in range(3):
+        width = (selector & 0x03) + 1
+        v = 0
+        for k in range(width):
+            v |= read_byte(buf, pos + k, size) << (8 * k)
+        pos += width
+        values[i + j] = sign_extend(v, 8 * width)
+        selector >>= 2
+    return pos
+
+
+@compiled
+def read_tag2_3s32(buf, pos, size, values, i):
+    lead = read_byte(buf, pos, size)
+    pos += 1
+    kind = lead >> 6
+    if kind == 0:
+        values[i] = sign_extend((lead >> 4) & 0x03, 2)
+        values[i + 1] = sign_extend((lead >> 2) & 0x03, 2)
+        values[i + 2] = sign_extend(lead & 0x03, 2)
+    elif kind == 1:
+        values[i] = sign_extend(lead & 0x0F, 4)
+        b = read_byte(buf, pos, size)
+        pos += 1
+        values[i + 1] = sign_extend(b >> 4, 4)
+        values[i + 2] = sign_extend(b & 0x0F, 4)
+    elif kind == 2:
+        values[i] = sign_extend(lead & 0x3F, 6)
+        values[i + 1] = sign_extend(read_byte(buf, pos, size) & 0x3F, 6)
+        values[i + 2] = sign_extend(read_byte(buf, pos + 1, size) & 0x3F, 6)
+        pos += 2
+    else:
+        pos = read_whole_bytes(buf, pos, size, values, i, lead)
+    return pos
+
+
+@compiled
+def read_tag2_3svariable(buf, pos, size, values, i):
+    lead = read_byte(buf, pos, size)
+    pos += 1
+    kind = lead >> 6
+    if kind == 0:
+        values[i] = sign_extend((lead >> 4) & 0x03, 2)
+        values[i + 1] = sign_extend((lead >> 2) & 0x03, 2)
+        values[i + 2] = sign_extend(lead & 0x03, 2)
+    elif kind == 1:
+        b1 = read_byte(buf, pos, size)
+        pos += 1
+        values[i] = sign_extend((lead & 0x3E) >> 1, 5)
+        values[i + 1] = sign_extend(((lead & 0x01) << 4) | (b1 >> 4), 5)
+        values[i + 2] = sign_extend(b1 & 0x0F, 4)
+    elif kind == 2:
+        b1 = read_byte(buf, pos, size)
+        b2 = read_byte(buf, pos + 1, size)
+        pos += 2
+        values[i] = sign_extend(((lead & 0x3F) << 2) | (b1 >> 6), 8)
+        values[i + 1] = sign_extend(((b1 & 0x3F) << 1) | (b2 >> 7), 7)
+        values[i + 2] = sign_extend(b2 & 0x7F, 7)
+    else:
+        pos = read_whole_bytes(buf, pos, size, values, i, lead)
+    return pos
+
+
+@compiled
+def read_tag8_4s16_v1(buf, pos, size, values, i):
+    selector = read_byte(buf, pos, size)
+    pos += 1
+    j = 0
+    while j < 4:
+        kind = selector & 0x03
+        if kind == 0:
+            values[i + j] = 0
+        elif kind == 1:
+            b = read_byte(buf, pos, size)
+            pos += 1
+            values[i + j] = sign_extend(b & 0x0F, 4)
+            j += 1
+            selector >>= 2
+            values[i + j] = sign_extend(b >> 4, 4)
+        elif kind == 2:
+            values[i + j] = sign_extend(read_byte(buf, pos, size), 8)
+            pos += 1
+        else:
+            values[i + j], pos = read_s16(buf, pos, size)
+        selector >>= 2
+        j += 1
+    return pos
+
+
+@compiled
+def read_tag8_4s16_v2(buf, pos, size, values, i):
+    selector = read_byte(buf, pos, size)
+    pos += 1
+    nibble = False
+    buffer = 0
+    for j in range(4):
+        kind = selector & 0x03
+        if kind == 0:
+            values[i + j] = 0
+        elif kind == 1:
+            if nibble:
+                values[i + j] = sign_extend(buffer & 0x0F, 4)
+            else:
+                buffer = read_byte(buf, pos, size)
+                pos += 1
+                values[i + j] = sign_extend(buffer >> 4, 4)
+            nibble = not nibble
+        elif kind == 2:
+            if nibble:
+                char1 = (buffer << 4) & 0xFF
+                buffer = read_byte(buf, pos, size)
+                pos += 1
+                values[i + j] = sign_extend(char1 | (buffer >> 4), 8)
+            else:
+                values[i + j] = sign_extend(read_byte(buf, pos, size), 8)
+                pos += 1
+        else:
+            char1 = read_byte(buf, pos, size)
+            char2 = read_byte(buf, pos + 1, size)
+            pos += 2
+            if nibble:
+                v = ((buffer << 12) | (char1 << 4) | (char2 >> 4)) & 0xFFFF
+                buffer = char2
+            else:
+                v = (char1 << 8) | char2
+            values[i + j] = sign_extend(v, 16)
+        selector >>= 2
+    return pos
+
+
+@compiled
+def read_fields(buf, pos, size, err, steps, bounds, values, data_version):
+    for i in range(len(values)):
+        values[i] = 0
+    for step in range(bounds[0], bounds[1]):
+        enc = steps[step][0]
+        i = steps[step][1]
+        if enc == ENCODING_SIGNED_VB:
+            values[i], pos = read_signed_vb(buf, pos, size, err)
+        elif enc == ENCODING_UNSIGNED_VB:
+            values[i], pos = read_unsigned_vb(buf, pos, size, err)
+        elif enc == ENCODING_TAG8_8SVB:
+            pos = read_tag8_8svb(buf, pos, size, err, values, i, steps[step][2])
+        elif enc == ENCODING_TAG2_3S32:
+            pos = read_tag2_3s32(buf, pos, size, values, i)
+        elif enc == ENCODING_TAG8_4S16:
+            if data_version < 2:
+                pos = read_tag8_4s16_v1(buf, pos, size, values, i)
+            else:
+                pos = read_tag8_4s16_v2(buf, pos, size, values, i)
+        elif enc == ENCODING_NEG_14BIT:
+            u, pos = read_unsigned_vb(buf, pos, size, err)
+            values[i] = -sign_extend(u, 14)
+        elif enc == ENCODING_TAG2_3SVARIABLE:
+            pos = read_tag2_3svariable(buf, pos, size, values, i)
+    return pos
+
+
+@compiled
+def predict(
+    predictors, bounds, current, previous, previous2, has_previous, skipped, params
+):
+    for k in range(bounds[0], bounds[1]):
+        i = predictors[k][0]
+        p = predictors[k][1]
+        if p == PREDICT_PREVIOUS:
+            if has_previous:
+                current[i] += previous[i]
+        elif p == PREDICT_STRAIGHT_LINE:
+            if has_previous:
+                current[i] += 2 * previous[i] - previous2[i]
+        elif p == PREDICT_AVERAGE_2:
+            if has_previous:
+                s = previous[i] + previous2[i]
+                current[i] += s // 2 if s >= 0 else -(-s // 2)
+        elif p == PREDICT_INC:
+            current[i] += skipped + 1
+            if has_previous:
+                current[i] += previous[i]
+        elif p == PREDICT_MOTOR_0:
+            current[i] += current[params[9]]
+        elif p == PREDICT_MINTHROTTLE:
+            current[i] += params[4]
+        elif p == PREDICT_MINMOTOR:
+            current[i] += params[6]
+        elif p == PREDICT_1500:
+            current[i] += 1500
+        elif p == PREDICT_VBATREF:
+            current[i] += params[5]
+        elif p == PREDICT_LAST_MAIN_FRAME_TIME:
+            if has_previous:
+                current[i] += previous[params[8]]
+
+
+@compiled
+def cast_fields(current, signed):
+    ### wraps the main frame values to 32 bits as blackbox_decode keeps them,
+    ### int32 for signed fields and uint32 for the rest
+    for i in range(len(signed)):
+        if signed[i]:
+            current[i] = sign_extend(current[i], 32)
+        else:
+            current[i] &= 0xFFFFFFFF
+
+
+@compiled
+def skipped_frames(last_iter, i_interval, p_num, p_denom):
+    ### frames the logging rate intentionally left out since the last main frame
+    count = 0
+    index = last_iter + 1
+    while (index % i_interval + p_num - 1) % p_denom >= p_num:
+        count += 1
+        index += 1
+    return count
+
+
+@compiled
+def read_event(buf, pos, size, err):
+    ### returns the position after the event, the event and, for a logging
+    ### resume, the iteration and time logging resumes at
+    event = read_byte(buf, pos, size)
+    pos += 1
+    resume_iter = 0
+    resume_time = 0
+    if event == EVENT_SYNC_BEEP:
+        _, pos = read_unsigned_vb(buf, pos, size, err)
+    elif event == EVENT_FLIGHTMODE:
+        _, pos = read_unsigned_vb(buf, pos, size, err)
+        _, pos = read_unsigned_vb(buf, pos, size, err)
+    elif event == EVENT_DISARM:
+        _, pos = read_unsigned_vb(buf, pos, size, err)
+    elif event == EVENT_INFLIGHT_ADJUSTMENT:
+        pos += 1
+        if read_byte(buf, pos - 1, size) & 0x80:
+            # new value as raw float
+            pos += 4
+        else:
+            _, pos = read_signed_vb(buf, pos, size, err)
+    elif event == EVENT_LOGGING_RESUME:
+        resume_iter, pos = read_unsigned_vb(buf, pos, size, err)
+        resume_time, pos = read_unsigned_vb(buf, pos, size, err)
+    elif event == EVENT_AUTOTUNE_CYCLE_START:
+        pos += 5
+    elif event == EVENT_AUTOTUNE_CYCLE_RESULT:
+        pos += 4
+    elif event == EVENT_AUTOTUNE_TARGETS:
+        pos += 8
+    elif event == EVENT_GTUNE_CYCLE_RESULT:
+        pos += 1
+        _, pos = read_signed_vb(buf, pos, size, err)
+        pos += 2
+    elif event == EVENT_LOG_END:
+        for k in range(len(LOG_END_MARKER)):
+            if read_byte(buf, pos + k, size) != LOG_END_MARKER[k]:
+                err[0] = 1  # bad log end marker
+    else:
+        err[0] = 1  # unknown event type
+    return pos, event, resume_iter, resume_time
+
+
+@compiled
+def resync(buf, pos, size, kinds):
+    ### the next byte that can start a frame
+    while pos < size and kinds[int(buf[pos])] == KIND_NONE:
+        pos += 1
+    return pos
+
+
+@compiled
+def decode_frames(
+    buf,
+    kinds,
+    steps,
+    step_bounds,
+    predictors,
+    predictor_bounds,
+    signed,
+    keep,
+    params,
+    values,
+    err,
+):
+    ### the values of the keep fields of every valid main frame, a row per
+    ### frame, and the number of corrupt frames skipped. see decode_session
+    ### for params, values and err and frame_tables for the rest.
+    data_version = params[0]
+    iter_idx = params[7]
+    time_idx = params[8]
+    size = len(buf)
+    current, previous, previous2, other = values[0], values[1], values[2], values[3]
+    rows = np.empty((1024, len(keep)), dtype=np.int64)
+    count = 0
+    has_previous = False
+    has_last = False
+    last_iter = 0
+    last_time = 0
+    valid = False
+    corrupt = 0
+
+    pos = 0
+    while pos < size:
+        frame_start = pos
+        kind = kinds[int(buf[pos])]
+        pos += 1
+        err[0] = 0
+        event = -1
+        if kind == 0 or kind == 1:
+            pos = read_fields(
+                buf, pos, size, err, steps, step_bounds[kind], current, data_version
+            )
+        elif kind == KIND_EVENT:
+            pos, event, resume_iter, resume_time = read_event(buf, pos, size, err)
+            if event == EVENT_LOGGING_RESUME:
+                last_iter = resume_iter
+                last_time = resume_time
+                has_last = True
+        elif kind >= 0:
+            pos = read_fields(
+                buf, pos, size, err, steps, step_bounds[kind], other, data_version
+            )
+        else:
+            err[0] = 1  # unknown frame type
+        if pos > size and not err[0]:
+            # truncated last frame
+            break
+        if event == EVENT_LOG_END and not err[0]:
+            break
+        if (
+            err[0]
+            or pos - frame_start > MAX_FRAME_LENGTH
+            or pos < size
+            and kinds[int(buf[pos])] == KIND_NONE
+        ):
+            # frame does not end where the next one starts: resync
+            corrupt += 1
+            valid = False
+            pos = resync(buf, frame_start + 1, size, kinds)
+            continue
+        if kind != 0 and kind != 1:
+            continue
+
+        if kind == 0:
+            predict(
+                predictors,
+                predictor_bounds[0],
+                current,
+                previous,
+                previous2,
+                has_previous,
+                0,
+                params,
+            )
+        elif valid:
+            skipped = 0
+            if has_last:
+                skipped = skipped_frames(last_iter, params[1], params[2], params[3])
+            predict(
+                predictors,
+                predictor_bounds[1],
+                current,
+                previous,
+                previous2,
+                has_previous,
+                skipped,
+                params,
+            )
+        cast_fields(current, signed)
+        iteration = current[iter_idx]
+        frametime = current[time_idx]
+        if kind == 0:
+            valid = not has_last or (iteration >= last_iter and frametime >= last_time)
+            if not valid:
+                continue
+            previous, current = current, previous
+            for i in range(len(previous)):
+                previous2[i] = previous[i]
+        else:
+            if not valid:
+                continue
+            if not (
+                last_iter <= iteration < last_iter + MAX_ITERATION_JUMP
+                and last_time <= frametime < last_time + MAX_TIME_JUMP
+            ):
+                valid = False
+                continue
+            previous2, previous, current = previous, current, previous2
+        has_previous = True
+        has_last = True
+        last_iter = iteration
+        last_time = frametime
+        if count == len(rows):
+            grown = np.empty((2 * len(rows), len(keep)), dtype=np.int64)
+            grown[:count] = rows
+            rows = grown
+        for j in range(len(keep)):
+            rows[count, j] = previous[keep[j]]
+        count += 1
+
+    return rows[:count], corrupt
@@ -0,0 +1,90 @@
+import logging
+import os
+
+import numpy as np
+
+### fft backends for the analysis. all have numpy.fft style rfft / irfft.
+### scipy.fft and pyFFTW run the transforms of a stack of windows on several threads.
+
+BACKENDS = ("numpy", "scipy", "pyfftw")
+FFT_WORKERS = os.cpu_count() or 1  # threads per transform for scipy and pyfftw
+
+
+class NumpyFFT:
+    name = "numpy"
+
+    def __str__(self):
+        return "numpy.fft"
+
+    def rfft(self, a, n=None, axis=-1, norm=None):
+        return np.fft.rfft(a, n, axis, norm)
+
+    def irfft(self, a, n=None, axis=-1, norm=None):
+        return np.fft.irfft(a, n, axis, norm)
+
+
+class ScipyFFT:
+    name = "scipy"
+
+    def __init__(self, workers=None):
+        import scipy.fft  # scipy >= 1.4
+
+        self.fft = scipy.fft
+        self.workers = workers or FFT_WORKERS
+
+    def __str__(self):
+        return "scipy.fft (%d workers)" % self.workers
+
+    def __reduce__(self):
+        # modules don't pickle, the backend is set up again in other processes
+        return self.__class__, (self.workers,)
+
+    def rfft(self, a, n=None, axis=-1, norm=None):
+        return self.fft.rfft(a, n, axis, norm, workers=self.workers)
+
+    def irfft(self, a, n=None, axis=-1, norm=None):
+        return self.fft.irfft(a, n, axis, norm, workers=self.workers)
+
+
+class PyFFTW:
+    ### plans are kept in the pyfftw interfaces cache and reused for equal shapes
+    name = "pyfftw"
+
+    def __init__(self, workers=None, keepalive=60.0):
+        self.keepalive = keepalive
+        import pyfftw.interfaces.cache
+        import pyfftw.interfaces.numpy_fft
+
+        pyfftw.interfaces.cache.enable()
+        pyfftw.interfaces.cache.set_keepalive_time(keepalive)
+        self.fft = pyfftw.interfaces.numpy_fft
+        self.workers = workers or FFT_WORKERS
+
+    def __str__(self):
+        return "pyFFTW (%d threads)" % self.workers
+
+    def __reduce__(self):
+        return self.__class__, (self.workers, self.keepalive)
+
+    def rfft(self, a, n=None, axis=-1, norm=None):
+        return self.fft.rfft(a, n, axis, norm, threads=self.workers)
+
+    def irfft(self, a, n=None, axis=-1, norm=None):
+        return self.fft.irfft(a, n, axis, norm, threads=self.workers)
+
+
+def get_backend(name="numpy", workers=None):
+    """Returns the fft backend by name, one of BACKENDS.
+
+    Raises ImportError if the library of the backend is not installed.
+    """
+    if name == "numpy":
+        backend = NumpyFFT()
+    elif name == "scipy":
+        backend = ScipyFFT(workers)
+    elif name == "pyfftw":
+        backend = PyFFTW(workers)
+    else:
+        raise ValueError("Unknown fft backend %r, use one of %s." % (name, BACKENDS))
+    logging.info("FFT backend: %s", backend)
+    return backend
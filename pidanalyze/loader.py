@@ -1,16 +1,59 @@
 import logging
+import mmap
 import os
 import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import numpy as np
-from pandas import read_csv
+
+from . import csvreader, decoder
 
 LOG_MIN_BYTES = 500000
+DECODE_WORKERS = os.cpu_count() or 1  # sessions decoded at once
+DECODE_TIMEOUT = 600.0  # seconds before a Blackbox_decode run is killed
+
+# keycheck for 'usecols' only reads usefull traces, uncommend if needed
+WANTED_FIELDS = {
+    "time (us)",
+    "rcCommand[0]",
+    "rcCommand[1]",
+    "rcCommand[2]",
+    "rcCommand[3]",
+    "axisP[0]",
+    "axisP[1]",
+    "axisP[2]",
+    "axisI[0]",
+    "axisI[1]",
+    "axisI[2]",
+    "axisD[0]",
+    "axisD[1]",
+    "axisD[2]",
+    "gyroADC[0]",
+    "gyroADC[1]",
+    "gyroADC[2]",
+    "gyroData[0]",
+    "gyroData[1]",
+    "gyroData[2]",
+    "ugyroADC[0]",
+    "ugyroADC[1]",
+    "ugyroADC[2]",
+    #'accSmooth[0]', 'accSmooth[1]', 'accSmooth[2]',
+    "debug[0]",
+    "debug[1]",
+    "debug[2]",
+    "debug[3]",
+    #'motor[0]', 'motor[1]', 'motor[2]', 'motor[3]',
+    #'energyCumulative (mAh)', 'vbatLatest (V)', 'amperageLatest (A)'
+}
 
 
 def deletejunk(loglist):
     for log in loglist:
         os.remove(log)
+        if not os.path.exists(f"{log[:-3]}01.csv"):
+            # decoded natively, no csv written
+            continue
         os.remove(f"{log[:-3]}01.csv")
         try:
             os.remove(f"{log[:-3]}01.event")
@@ -18,232 +61,480 @@ def deletejunk(loglist):
             logging.warning("No .event file of %s found.", log)
 
 
-def beheader(loglist, tmp_dir):
+def beheader(index, tmp_dir):
     heads = []
-    for i, bblog in enumerate(loglist):
-        log = open(os.path.join(tmp_dir, bblog), "rb")
-        lines = log.readlines()
-        ### in case info is not provided by log, empty str is printed in plot
-        head = {
-            "tempFile": "",
-            "dynThrottle": "",
-            "craftName": "",
-            "fwType": "",
-            "version": "",
-            "date": "",
-            "rcRate": "",
-            "rcExpo": "",
-            "rcYawExpo": "",
-            "rcYawRate": "",
-            "rates": "",
-            "rollPID": "",
-            "pitchPID": "",
-            "yawPID": "",
-            "deadBand": "",
-            "yawDeadBand": "",
-            "logNum": "",
-            "tpa_breakpoint": "0",
-            "minThrottle": "",
-            "maxThrottle": "",
-            "tpa_percent": "",
-            "dTermSetPoint": "",
-            "vbatComp": "",
-            "gyro_lpf": "",
-            "gyro_lowpass_type": "",
-            "gyro_lowpass_hz": "",
-            "gyro_notch_hz": "",
-            "gyro_notch_cutoff": "",
-            "dterm_filter_type": "",
-            "dterm_lpf_hz": "",
-            "yaw_lpf_hz": "",
-            "dterm_notch_hz": "",
-            "dterm_notch_cutoff": "",
-            "debug_mode": "",
-        }
-        ### different versions of fw have different names for the same thing.
-        translate_dict = {
-            "dynThrPID:": "dynThrottle",
-            "Craft name:": "craftName",
-            "Firmware type:": "fwType",
-            "Firmware revision:": "version",
-            "Firmware date:": "fwDate",
-            "rcRate:": "rcRate",
-            "rc_rate:": "rcRate",
-            "rcExpo:": "rcExpo",
-            "rc_expo:": "rcExpo",
-            "rcYawExpo:": "rcYawExpo",
-            "rc_expo_yaw:": "rcYawExpo",
-            "rcYawRate:": "rcYawRate",
-            "rc_rate_yaw:": "rcYawRate",
-            "rates:": "rates",
-            "rollPID:": "rollPID",
-            "pitchPID:": "pitchPID",
-            "yawPID:": "yawPID",
-            " deadband:": "deadBand",
-            "yaw_deadband:": "yawDeadBand",
-            "tpa_breakpoint:": "tpa_breakpoint",
-            "minthrottle:": "minThrottle",
-            "maxthrottle:": "maxThrottle",
-            "dtermSetpointWeight:": "dTermSetPoint",
-            "dterm_setpoint_weight:": "dTermSetPoint",
-            "vbat_pid_compensation:": "vbatComp",
-            "vbat_pid_gain:": "vbatComp",
-            "gyro_lpf:": "gyro_lpf",
-            "gyro_lowpass_type:": "gyro_lowpass_type",
-            "gyro_lowpass_hz:": "gyro_lowpass_hz",
-            "gyro_lpf_hz:": "gyro_lowpass_hz",
-            "gyro_notch_hz:": "gyro_notch_hz",
-            "gyro_notch_cutoff:": "gyro_notch_cutoff",
-            "dterm_filter_type:": "dterm_filter_type",
-            "dterm_lpf_hz:": "dterm_lpf_hz",
-            "yaw_lpf_hz:": "yaw_lpf_hz",
-            "dterm_notch_hz:": "dterm_notch_hz",
-            "dterm_notch_cutoff:": "dterm_notch_cutoff",
-            "debug_mode:": "debug_mode",
-        }
-
-        head["tempFile"] = bblog
-        head["logNum"] = str(i)
-        ### check for known keys and translate to useful ones.
-        for raw_line in lines:
-            ln = raw_line.decode("latin-1")
-            for key in translate_dict:
-                if key in ln:
-                    val = ln.split(":")[-1]
-                    head[translate_dict[key]] = val[:-1]
-
+    for i, session in enumerate(index.sessions):
+        number, offset, length = session
+        # only the header block is read, parsing stops at the first frame
+        fields, _ = decoder.parse_header(index.buf, offset, offset + length)
+        head = translate_head(fields, i, index.temp_path(tmp_dir, session))
+        head["session"] = session
         heads.append(head)
     return heads
 
 
-def decode(fpath, tmp_dir, blackbox_decode_bin_path):
-    """Splits out one BBL per recorded session and converts each to CSV."""
+### in case info is not provided by log, empty str is printed in plot
+HEAD_DEFAULTS = {
+    "tempFile": "",
+    "dynThrottle": "",
+    "craftName": "",
+    "fwType": "",
+    "version": "",
+    "date": "",
+    "rcRate": "",
+    "rcExpo": "",
+    "rcYawExpo": "",
+    "rcYawRate": "",
+    "rates": "",
+    "rollPID": "",
+    "pitchPID": "",
+    "yawPID": "",
+    "deadBand": "",
+    "yawDeadBand": "",
+    "logNum": "",
+    "tpa_breakpoint": "0",
+    "minThrottle": "",
+    "maxThrottle": "",
+    "tpa_percent": "",
+    "dTermSetPoint": "",
+    "vbatComp": "",
+    "gyro_lpf": "",
+    "gyro_lowpass_type": "",
+    "gyro_lowpass_hz": "",
+    "gyro_notch_hz": "",
+    "gyro_notch_cutoff": "",
+    "dterm_filter_type": "",
+    "dterm_lpf_hz": "",
+    "yaw_lpf_hz": "",
+    "dterm_notch_hz": "",
+    "dterm_notch_cutoff": "",
+    "debug_mode": "",
+}
 
-    with open(fpath, "rb") as binary_log_view:
-        content = binary_log_view.read()
+### different versions of fw have different names for the same thing.
+### header field name -> head key
+TRANSLATE_HEAD = {
+    "dynThrPID": "dynThrottle",
+    "Craft name": "craftName",
+    "Firmware type": "fwType",
+    "Firmware revision": "version",
+    "Firmware date": "fwDate",
+    "rcRate": "rcRate",
+    "rc_rate": "rcRate",
+    "rcExpo": "rcExpo",
+    "rc_expo": "rcExpo",
+    "rcYawExpo": "rcYawExpo",
+    "rc_expo_yaw": "rcYawExpo",
+    "rcYawRate": "rcYawRate",
+    "rc_rate_yaw": "rcYawRate",
+    "rates": "rates",
+    "rollPID": "rollPID",
+    "pitchPID": "pitchPID",
+    "yawPID": "yawPID",
+    "deadband": "deadBand",
+    "yaw_deadband": "yawDeadBand",
+    "tpa_breakpoint": "tpa_breakpoint",
+    "minthrottle": "minThrottle",
+    "maxthrottle": "maxThrottle",
+    "dtermSetpointWeight": "dTermSetPoint",
+    "dterm_setpoint_weight": "dTermSetPoint",
+    "vbat_pid_compensation": "vbatComp",
+    "vbat_pid_gain": "vbatComp",
+    "gyro_lpf": "gyro_lpf",
+    "gyro_lowpass_type": "gyro_lowpass_type",
+    "gyro_lowpass_hz": "gyro_lowpass_hz",
+    "gyro_lpf_hz": "gyro_lowpass_hz",
+    "gyro_notch_hz": "gyro_notch_hz",
+    "gyro_notch_cutoff": "gyro_notch_cutoff",
+    "dterm_filter_type": "dterm_filter_type",
+    "dterm_lpf_hz": "dterm_lpf_hz",
+    "yaw_lpf_hz": "yaw_lpf_hz",
+    "dterm_notch_hz": "dterm_notch_hz",
+    "dterm_notch_cutoff": "dterm_notch_cutoff",
+    "debug_mode": "debug_mode",
+}
+
+AXES = ("roll", "pitch", "yaw")
+RATE_KEYS = ("rcRate", "rcExpo", "rcYawRate", "rcYawExpo", "rates")
+FILTER_KEYS = (
+    "gyro_lowpass_hz",
+    "gyro_notch_hz",
+    "gyro_notch_cutoff",
+    "dterm_lpf_hz",
+    "yaw_lpf_hz",
+    "dterm_notch_hz",
+    "dterm_notch_cutoff",
+)
 
-    # The first line of the overall BBL file re-appears at the beginning
-    # of each recorded session.
+
+def to_floats(value):
+    ### "45,80,30" -> (45.0, 80.0, 30.0), () if not numeric
     try:
-        first_newline_index = content.index(str("\n").encode("utf8"))
-    except ValueError as e:
-        raise ValueError(
-            "No newline in %dB of log data from %r." % (len(content), fpath), e
-        )
-    firstline = content[: first_newline_index + 1]
+        return tuple(float(v) for v in value.split(","))
+    except ValueError:
+        return ()
 
-    split = content.split(firstline)
-    bbl_sessions = []
-    for i in range(len(split)):
-        path_root, path_ext = os.path.splitext(os.path.basename(fpath))
-        temp_path = os.path.join(tmp_dir, "%s_temp%d%s" % (path_root, i, path_ext))
-        with open(temp_path, "wb") as newfile:
-            newfile.write(firstline + split[i])
-        bbl_sessions.append(temp_path)
 
-    loglist = []
-    for bbl_session in bbl_sessions:
-        size_bytes = os.path.getsize(os.path.join(tmp_dir, bbl_session))
-        if size_bytes > LOG_MIN_BYTES:
-            try:
-                msg = subprocess.check_call([blackbox_decode_bin_path, bbl_session])
-                loglist.append(bbl_session)
-            except:
-                logging.error(
-                    "Error in Blackbox_decode of %r" % bbl_session, exc_info=True
-                )
+class Header(dict):
+    """Translated header of a session.
+
+    The str values are printed in the plots as they are. The numbers the
+    analysis needs are parsed once: ``pids`` and ``rates`` / ``filters``
+    map to tuples of floats (empty if the log has no such field),
+    ``min_throttle``, ``max_throttle``, ``tpa_breakpoint`` and
+    ``tpa_percent`` are floats or None.
+    """
+
+    def __init__(self, fields):
+        super().__init__(fields)
+        self.pids = {axis: to_floats(self[axis + "PID"]) for axis in AXES}
+        self.rates = {key: to_floats(self[key]) for key in RATE_KEYS}
+        self.filters = {key: to_floats(self[key]) for key in FILTER_KEYS}
+        self.min_throttle = (to_floats(self["minThrottle"]) or (None,))[0]
+        self.max_throttle = (to_floats(self["maxThrottle"]) or (None,))[0]
+        self.tpa_breakpoint = (to_floats(self["tpa_breakpoint"]) or (None,))[0]
+        if self.pid_scaled or self.tpa_breakpoint is None:
+            self.tpa_percent = 0.0
         else:
-            # There is often a small bogus session at the start of the file.
-            logging.warning(
-                "Ignoring BBL session %r, %dB < %dB."
-                % (bbl_session, size_bytes, LOG_MIN_BYTES)
+            self.tpa_percent = (self.tpa_breakpoint - 1000.0) / 10.0
+        self["tpa_percent"] = self.tpa_percent
+
+    @property
+    def pid_scaled(self):
+        ### these fw log the PID loop input already scaled by P
+        return "KISS" in self["fwType"] or "Raceflight" in self["fwType"]
+
+
+def translate_head(fields, lognum, temp_file):
+    ### fields are the raw header values by name, see decoder.parse_header
+    head = dict(HEAD_DEFAULTS)
+    head["tempFile"] = temp_file
+    head["logNum"] = str(lognum)
+    ### check for known keys and translate to useful ones.
+    for name, value in fields.items():
+        key = TRANSLATE_HEAD.get(name)
+        if key is not None:
+            head[key] = value
+    return Header(head)
+
+
+class SessionIndex:
+    """Offsets of the recorded sessions in a memory-mapped BBL file.
+
+    Sessions of LOG_MIN_BYTES or less are dropped while indexing. Each kept
+    session is a (number, offset, length) tuple into ``buf``; copies are only
+    written by write() when a decoder needs a file path. ``sessions`` found
+    by an earlier index of the same file are taken as they are, the file is
+    not scanned again.
+    """
+
+    def __init__(self, fpath, sessions=None):
+        self.fpath = fpath
+        with open(fpath, "rb") as binary_log_view:
+            if os.fstat(binary_log_view.fileno()).st_size:
+                self.buf = mmap.mmap(
+                    binary_log_view.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            else:
+                self.buf = b""
+        if sessions is not None:
+            self.sessions = list(sessions)
+            return
+
+        # The first line of the overall BBL file re-appears at the beginning
+        # of each recorded session.
+        first_newline_index = self.buf.find(b"\n")
+        if first_newline_index < 0:
+            raise ValueError(
+                "No newline in %dB of log data from %r." % (len(self.buf), fpath)
             )
+        firstline = self.buf[: first_newline_index + 1]
+
+        starts = []
+        offset = self.buf.find(firstline)
+        while offset >= 0:
+            starts.append(offset)
+            offset = self.buf.find(firstline, offset + len(firstline))
+        ends = starts[1:] + [len(self.buf)]
+
+        self.sessions = []
+        for number, (start, end) in enumerate(zip(starts, ends), 1):
+            if end - start > LOG_MIN_BYTES:
+                self.sessions.append((number, start, end - start))
+            else:
+                # There is often a small bogus session at the start of the file.
+                logging.warning(
+                    "Ignoring BBL session %d of %r, %dB < %dB."
+                    % (number, fpath, end - start, LOG_MIN_BYTES)
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+
+    def temp_path(self, tmp_dir, session):
+        path_root, path_ext = os.path.splitext(os.path.basename(self.fpath))
+        return os.path.join(tmp_dir, "%s_temp%d%s" % (path_root, session[0], path_ext))
+
+    def write(self, session, path, blocksize=1 << 20):
+        number, offset, length = session
+        with open(path, "wb") as newfile:
+            for start in range(offset, offset + length, blocksize):
+                newfile.write(self.buf[start : min(start + blocksize, offset + length)])
+        return path
+
+
+def readsessions(
+    index,
+    heads,
+    blackbox_decode_bin_path=None,
+    stream=True,
+    workers=None,
+    timeout=None,
+    cache=None,
+):
+    """Yields (head, data) for each head, data is None if decoding failed.
+
+    blackbox_decode_bin_path=None uses the built-in decoder, otherwise
+    Blackbox_decode is run on a pipe (stream) or through temp csv files.
+    Either decodes up to ``workers`` sessions at once.
+    Sessions found in ``cache`` are not decoded again, newly decoded ones are
+    added to it.
+    """
+    keys = [None] * len(heads)
+    data = [None] * len(heads)
+    if cache is not None:
+        decoded_by = decoder_id(blackbox_decode_bin_path)
+        for i, head in enumerate(heads):
+            number, offset, length = head["session"]
+            keys[i] = cache.key(index.buf, offset, length, decoded_by)
+            data[i] = cache.load(keys[i], decoded_by)
+    todo = [head for head, hit in zip(heads, data) if hit is None]
+
+    loglist = []
+    if blackbox_decode_bin_path is None:
+        decoded = iter(decode_native(index, todo, workers))
+    elif stream:
+        decoded = iter(
+            decode_stream(index, todo, blackbox_decode_bin_path, workers, timeout)
+        )
+    else:
+        loglist = decode(index, todo, blackbox_decode_bin_path, workers, timeout)
+        decoded = (
+            (
+                readcsv(head["tempFile"][:-3] + "01.csv")
+                if head["tempFile"] in loglist
+                else None
+            )
+            for head in todo
+        )
+
+    try:
+        for i, head in enumerate(heads):
+            if data[i] is None:
+                data[i] = next(decoded)
+                if data[i] is not None and cache is not None:
+                    cache.store(keys[i], data[i], decoded_by)
+            yield head, data[i]
+            data[i] = None
+    finally:
+        deletejunk(loglist)
+
+
+def decoder_id(blackbox_decode_bin_path=None):
+    ### names the decoder of the sessions and its version for the cache, a
+    ### Blackbox_decode binary by its size and modification time
+    if blackbox_decode_bin_path is None:
+        return f"native {decoder.VERSION}"
+    try:
+        stat = os.stat(blackbox_decode_bin_path)
+    except OSError:
+        return "blackbox_decode"
+    return f"blackbox_decode {stat.st_size} {stat.st_mtime_ns}"
+
+
+def decode(index, heads, blackbox_decode_bin_path, workers=None, timeout=None):
+    """Writes the BBL of each head and converts it to CSV.
+
+    Up to ``workers`` sessions are converted at once, each one is given
+    ``timeout`` seconds. Returns the temp BBLs that were converted.
+    """
+    loglist = [index.write(head["session"], head["tempFile"]) for head in heads]
+
+    timeout = DECODE_TIMEOUT if timeout is None else timeout
+    with ThreadPoolExecutor(max_workers=workers or DECODE_WORKERS) as pool:
+        decoded = list(
+            pool.map(
+                lambda bbl_session: run_blackbox_decode(
+                    blackbox_decode_bin_path, bbl_session, timeout
+                ),
+                loglist,
+            )
+        )
+    for bbl_session, ok in zip(loglist, decoded):
+        if not ok:
             os.remove(bbl_session)
-    return loglist
+    # map keeps the session order
+    return [bbl_session for bbl_session, ok in zip(loglist, decoded) if ok]
+
+
+def run_blackbox_decode(blackbox_decode_bin_path, bbl_session, timeout):
+    ### converts one session, errors only drop that session
+    try:
+        subprocess.check_call([blackbox_decode_bin_path, bbl_session], timeout=timeout)
+        return True
+    except subprocess.TimeoutExpired:
+        logging.error(
+            "Blackbox_decode of %r timed out after %gs." % (bbl_session, timeout)
+        )
+    except:
+        logging.error("Error in Blackbox_decode of %r" % bbl_session, exc_info=True)
+    return False
+
+
+def decode_stream(index, heads, blackbox_decode_bin_path, workers=None, timeout=None):
+    """Converts the indexed sessions with the csv read from a pipe.
+
+    Returns the data dict of each head, None where decoding failed. Only the
+    temp BBL Blackbox_decode needs as input is written, and removed again.
+    """
+    timeout = DECODE_TIMEOUT if timeout is None else timeout
+
+    def stream_session(head):
+        index.write(head["session"], head["tempFile"])
+        try:
+            return run_blackbox_stream(
+                blackbox_decode_bin_path, head["tempFile"], timeout
+            )
+        finally:
+            os.remove(head["tempFile"])
+
+    with ThreadPoolExecutor(max_workers=workers or DECODE_WORKERS) as pool:
+        return list(pool.map(stream_session, heads))
+
+
+def run_blackbox_stream(blackbox_decode_bin_path, bbl_session, timeout):
+    ### like run_blackbox_decode, with --stdout parsed into columns on the fly
+    process = subprocess.Popen(
+        [blackbox_decode_bin_path, "--stdout", bbl_session], stdout=subprocess.PIPE
+    )
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    try:
+        columns = csvreader.read_stream(process.stdout, WANTED_FIELDS)
+        process.wait()
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, process.args)
+        return build_data(columns)
+    except:
+        process.kill()
+        if not timer.is_alive():
+            logging.error(
+                "Blackbox_decode of %r timed out after %gs." % (bbl_session, timeout)
+            )
+        else:
+            logging.error("Error in Blackbox_decode of %r" % bbl_session, exc_info=True)
+        return None
+    finally:
+        timer.cancel()
+        process.stdout.close()
+        process.wait()
+        # some versions still write the event file next to the log
+        if os.path.exists(f"{bbl_session[:-3]}01.event"):
+            os.remove(f"{bbl_session[:-3]}01.event")
 
 
 def readcsv(fpath):
-    # keycheck for 'usecols' only reads usefull traces, uncommend if needed
-    wanted = {
-        "time (us)",
-        "rcCommand[0]",
-        "rcCommand[1]",
-        "rcCommand[2]",
-        "rcCommand[3]",
-        "axisP[0]",
-        "axisP[1]",
-        "axisP[2]",
-        "axisI[0]",
-        "axisI[1]",
-        "axisI[2]",
-        "axisD[0]",
-        "axisD[1]",
-        "axisD[2]",
-        "gyroADC[0]",
-        "gyroADC[1]",
-        "gyroADC[2]",
-        "gyroData[0]",
-        "gyroData[1]",
-        "gyroData[2]",
-        "ugyroADC[0]",
-        "ugyroADC[1]",
-        "ugyroADC[2]",
-        #'accSmooth[0]', 'accSmooth[1]', 'accSmooth[2]',
-        "debug[0]",
-        "debug[1]",
-        "debug[2]",
-        "debug[3]",
-        #'motor[0]', 'motor[1]', 'motor[2]', 'motor[3]',
-        #'energyCumulative (mAh)', 'vbatLatest (V)', 'amperageLatest (A)'
-    }
-    dframe = read_csv(
-        fpath,
-        header=0,
-        skipinitialspace=1,
-        usecols=lambda k: k in wanted,
-        dtype=np.float64,
+    return build_data(csvreader.read_csv(fpath, WANTED_FIELDS))
+
+
+def decode_native(index, heads, workers=None):
+    """Decodes the indexed sessions with the built-in decoder.
+
+    Up to ``workers`` sessions are decoded at once, in threads if the decoder
+    is compiled (it then releases the GIL), else in processes. Returns the
+    data dict of each head.
+    """
+    workers = min(workers or DECODE_WORKERS, len(heads))
+    if workers <= 1:
+        return [readsession(index, head) for head in heads]
+    if decoder.COMPILED:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda head: readsession(index, head), heads))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(readsession_file, [index.fpath] * len(heads), heads))
+
+
+def readsession(index, head):
+    """Decodes a session of a SessionIndex without blackbox_decode."""
+    number, offset, length = head["session"]
+    return build_data(
+        decoder.decode_session(index.buf, offset, offset + length, wanted=WANTED_FIELDS)
     )
+
+
+def readsession_file(fpath, head):
+    ### readsession in a worker process, which maps the log itself
+    with open(fpath, "rb") as binary_log_view:
+        buf = mmap.mmap(binary_log_view.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        number, offset, length = head["session"]
+        return build_data(
+            decoder.decode_session(buf, offset, offset + length, wanted=WANTED_FIELDS)
+        )
+    finally:
+        buf.close()
+
+
+def build_data(columns):
+    ### maps the csv columns to the traces used in the analysis
     data = {}
-    data["time_us"] = dframe["time (us)"].values * 1e-6
-    data["throttle"] = dframe["rcCommand[3]"].values
+    data["time_us"] = columns["time (us)"] * 1e-6
+    data["throttle"] = columns["rcCommand[3]"]
 
     for i in [0, 1, 2]:
-        data[f"rcCommand{i}"] = dframe[f"rcCommand[{i}]"].values
-        if f"debug[{i}]" in dframe:
-            data[f"debug{i}"] = dframe[f"debug[{i}]"].values
+        data[f"rcCommand{i}"] = columns[f"rcCommand[{i}]"]
+        if f"debug[{i}]" in columns:
+            data[f"debug{i}"] = columns[f"debug[{i}]"]
         else:
             logging.warning("No debug[%s] trace found!", i)
-            data[f"debug{i}"] = np.zeros_like(dframe[f"rcCommand[{i}]"].values)
+            data[f"debug{i}"] = np.zeros_like(columns[f"rcCommand[{i}]"])
 
         # get P trace (including case of missing trace)
-        if f"axisP[{i}]" in dframe:
-            data[f"PID loop in{i}"] = dframe[f"axisP[{i}]"].values
+        if f"axisP[{i}]" in columns:
+            data[f"PID loop in{i}"] = columns[f"axisP[{i}]"]
         else:
             logging.warning("No P[%s] trace found!", i)
-            data[f"PID loop in{i}"] = np.zeros_like(dframe[f"rcCommand[{i}]"].values)
+            data[f"PID loop in{i}"] = np.zeros_like(columns[f"rcCommand[{i}]"])
 
-        if f"axisD[{i}]" in dframe:
-            data[f"d_err{i}"] = dframe[f"axisD[{i}]"].values
+        if f"axisD[{i}]" in columns:
+            data[f"d_err{i}"] = columns[f"axisD[{i}]"]
         else:
             logging.warning("No D[%s] trace found!", i)
-            data[f"d_err{i}"] = np.zeros_like(dframe[f"rcCommand[{i}]"].values)
+            data[f"d_err{i}"] = np.zeros_like(columns[f"rcCommand[{i}]"])
 
-        if f"axisI[{i}]" in dframe:
-            data[f"I_term{i}"] = dframe[f"axisI[{i}]"].values
+        if f"axisI[{i}]" in columns:
+            data[f"I_term{i}"] = columns[f"axisI[{i}]"]
         else:
             if i < 2:
                 logging.warning("No I[%s] trace found!", i)
-            data[f"I_term{i}"] = np.zeros_like(dframe[f"rcCommand[{i}]"].values)
+            data[f"I_term{i}"] = np.zeros_like(columns[f"rcCommand[{i}]"])
 
         data[f"PID sum{i}"] = (
             data[f"PID loop in{i}"] + data[f"I_term{i}"] + data[f"d_err{i}"]
         )
-        if "gyroADC[0]" in dframe:
-            data[f"gyroData{i}"] = dframe[f"gyroADC[{i}]"].values
-        elif "gyroData[0]" in dframe:
-            data[f"gyroData{i}"] = dframe[f"gyroData[{i}]"].values
-        elif "ugyroADC[0]" in dframe:
-            data[f"gyroData{i}"] = dframe[f"ugyroADC[{i}]"].values
+        if "gyroADC[0]" in columns:
+            data[f"gyroData{i}"] = columns[f"gyroADC[{i}]"]
+        elif "gyroData[0]" in columns:
+            data[f"gyroData{i}"] = columns[f"gyroData[{i}]"]
+        elif "ugyroADC[0]" in columns:
+            data[f"gyroData{i}"] = columns[f"ugyroADC[{i}]"]
         else:
             logging.warning("No gyro trace found!")
 
@@ -252,12 +543,10 @@ def readcsv(fpath):
 
 def find_traces(data, head):
     time = data["time_us"]
-    throttle = (
-        (data["throttle"] - 1000.0) / (float(head["maxThrottle"]) - 1000.0)
-    ) * 100.0
+    throttle = ((data["throttle"] - 1000.0) / (head.max_throttle - 1000.0)) * 100.0
 
     traces = []
-    for i, name in enumerate(["roll", "pitch", "yaw"]):
+    for i, name in enumerate(AXES):
         trace_data = {"name": name, "time": time, "throttle": throttle}
         trace_data["p_err"] = data[f"PID loop in{i}"]
         trace_data["rcinput"] = data[f"rcCommand{i}"]
@@ -265,14 +554,6 @@ def find_traces(data, head):
         trace_data["PIDsum"] = data[f"PID sum{i}"]
         trace_data["d_err"] = data[f"d_err{i}"]
         trace_data["debug"] = data[f"debug{i}"]
-        if "KISS" in head["fwType"]:
-            trace_data["P"] = 1.0
-            head["tpa_percent"] = 0.0
-        elif "Raceflight" in head["fwType"]:
-            trace_data["P"] = 1.0
-            head["tpa_percent"] = 0.0
-        else:
-            trace_data["P"] = float((head[trace_data["name"] + "PID"]).split(",")[0])
-            head["tpa_percent"] = (float(head["tpa_breakpoint"]) - 1000.0) / 10.0
+        trace_data["P"] = 1.0 if head.pid_scaled else head.pids[name][0]
         traces.append(trace_data)
     return traces
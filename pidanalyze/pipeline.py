@@ -0,0 +1,151 @@
+import logging
+import queue
+import threading
+import time
+
+### stages of work running in their own threads, connected by bounded queues.
+
+QUEUE_SIZE = 2  # items waiting in front of each stage
+
+_DONE = object()
+
+
+class Failure:
+    ### passed on instead of the item when a stage raised, later stages skip it
+    def __init__(self, stage, error):
+        self.stage = stage
+        self.error = error
+
+    def __str__(self):
+        return f"{self.stage}: {type(self.error).__name__}: {self.error}"
+
+
+class Stage:
+    """One step of a Pipeline, ``func`` is called on every item by ``workers`` threads.
+
+    At most ``queue_size`` items wait in front of the stage, a full queue
+    blocks the stage before it. The stage counts how long its threads were
+    busy, starved (waiting for items) and blocked (waiting for room in the
+    next queue).
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=QUEUE_SIZE):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+
+
+class Pipeline:
+    """Runs items through stages, each item is in one stage at a time.
+
+    While one item is in the last stage the next ones are in earlier stages,
+    limited by the stage workers and queue sizes, so memory stays bounded
+    however many items are fed in.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.results = queue.Queue()
+        self.seconds = 0.0
+
+    def run(self, items):
+        """Yields (number, result) for the items in the order they are finished.
+
+        ``number`` is the position of the item in ``items``, ``result`` is
+        what the last stage returned or a Failure.
+        """
+        start = time.time()
+        threads = [threading.Thread(target=self.feed, args=(items,), daemon=True)]
+        nexts = [stage.queue for stage in self.stages[1:]] + [self.results]
+        ends = [stage.workers for stage in self.stages[1:]] + [1]
+        for stage, out, end in zip(self.stages, nexts, ends):
+            stage.running = stage.workers
+            for i in range(stage.workers):
+                threads.append(
+                    threading.Thread(
+                        target=self.work,
+                        args=(stage, out, end),
+                        name=f"{stage.name}-{i}",
+                        daemon=True,
+                    )
+                )
+        for thread in threads:
+            thread.start()
+        while True:
+            result = self.results.get()
+            if result is _DONE:
+                break
+            yield result
+        for thread in threads:
+            thread.join()
+        self.seconds = time.time() - start
+
+    def feed(self, items):
+        first = self.stages[0]
+        for number, item in enumerate(items):
+            first.queue.put((number, item))
+        for i in range(first.workers):
+            first.queue.put(_DONE)
+
+    @staticmethod
+    def work(stage, out, end):
+        while True:
+            waited = time.time()
+            job = stage.queue.get()
+            started = time.time()
+            if job is _DONE:
+                with stage.lock:
+                    stage.running -= 1
+                    last = not stage.running
+                    stage.starved += started - waited
+                if last:
+                    for i in range(end):
+                        out.put(_DONE)
+                return
+            number, item = job
+            if not isinstance(item, Failure):
+                try:
+                    item = stage.func(item)
+                except Exception as error:
+                    logging.exception("%s failed on item %d", stage.name, number)
+                    item = Failure(stage.name, error)
+            done = time.time()
+            out.put((number, item))
+            with stage.lock:
+                stage.items += 1
+                stage.starved += started - waited
+                stage.busy += done - started
+                stage.blocked += time.time() - done
+
+    def report(self):
+        ### utilization of every stage, busy time over the run time of its workers
+        report = {}
+        for stage in self.stages:
+            report[stage.name] = {
+                "workers": stage.workers,
+                "items": stage.items,
+                "busy": round(stage.busy, 3),
+                "starved": round(stage.starved, 3),
+                "blocked": round(stage.blocked, 3),
+                "utilization": round(
+                    stage.busy / max(self.seconds * stage.workers, 1e-9), 3
+                ),
+            }
+            logging.info(
+                "Stage %s: %d items, %.0f%% busy on %d workers, "
+                "%.1fs starved, %.1fs blocked",
+                stage.name,
+                stage.items,
+                100 * report[stage.name]["utilization"],
+                stage.workers,
+                stage.starved,
+                stage.blocked,
+            )
+        return report
@@ -1,12 +1,151 @@
 import logging
 import numpy as np
-from matplotlib import rcParams
 import matplotlib.pyplot as plt
+from matplotlib import cm
+from matplotlib.artist import setp
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from matplotlib.gridspec import GridSpec
 import matplotlib.colors as colors
 
 from . import __version__
 
+### the plots are built on their own Figure and take their style per call, without
+### pyplot or rcParams, so several can be rendered at once in threads. show=True
+### makes them pyplot figures instead, for plt.show().
+
+FIGSIZE = (16, 8)
+FONT_SIZE = 9  # of labels, ticks and legends, titles are "large" (1.2x)
+TEXT_SIZE = 7  # of the header and filter notes
+
+
+def new_figure(label, show=False):
+    if show:
+        return plt.figure(label, figsize=FIGSIZE)
+    fig = Figure(figsize=FIGSIZE)
+    fig.set_label(label)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def set_fontsize(fig, fontsize):
+    ### tick labels are only made when drawing, they get the size this way
+    for ax in fig.axes:
+        ax.tick_params(labelsize=fontsize)
+        ax.xaxis.offsetText.set_fontsize(fontsize)
+        ax.yaxis.offsetText.set_fontsize(fontsize)
+
+
+def alpha_cmap(name):
+    ### colormap fading in from transparent to half opaque
+    base = cm.get_cmap(name)
+    rgba = base(np.arange(base.N))
+    rgba[:, -1] = np.abs(np.linspace(0.0, 0.5, base.N, dtype=np.float64))
+    cmap = colors.ListedColormap(rgba, f"{name}_alpha")
+    cmap.set_under(base(0))
+    cmap.set_over(base(base.N - 1))
+    cmap.set_bad(base(np.nan))
+    return cmap
+
+
+def evenly_spaced(axis, rtol=1e-3):
+    step = np.diff(axis)
+    return len(step) > 0 and np.allclose(step, step[0], rtol=rtol, atol=0.0)
+
+
+def byte_cmap(cmap):
+    ### cmap with its colors on whole 8 bit levels, plus a quarter level. images
+    ### truncate colors to 8 bit where Agg rounds the colors of polygons, with
+    ### this both give the levels pcolormesh gives with cmap
+    cmap = cm.get_cmap(cmap)
+    rgba = (np.round(cmap(np.arange(cmap.N)) * 255.0) + 0.25) / 255.0
+    return colors.ListedColormap(np.minimum(rgba, 1.0), cmap.name)
+
+
+def grid_image(ax, x, y, c, cmap=None, **kwargs):
+    """Draws c like pcolormesh(x, y, c) with flat shading, as one image.
+
+    An image is resampled once to the pixels of the axes, instead of one
+    polygon drawn per cell. As with flat shading x and y are the cell
+    edges and the extent of the image, c is cut to len(y) - 1 rows and
+    len(x) - 1 columns. Unevenly spaced x or y are still drawn with
+    pcolormesh.
+    """
+    if not (evenly_spaced(x) and evenly_spaced(y)):
+        return ax.pcolormesh(x, y, c, cmap=cmap, **kwargs)
+    return ax.imshow(
+        c[: len(y) - 1, : len(x) - 1],
+        cmap=byte_cmap(cmap),
+        origin="lower",
+        aspect="auto",
+        interpolation="nearest",
+        extent=(x[0], x[-1], y[0], y[-1]),
+        **kwargs,
+    )
+
+
+def band_image(ax, x, y, z, cmap, levels):
+    """Draws the bands of contourf(x, y, z, levels=levels) as one image.
+
+    For filled contours without contour lines: every value between two
+    levels gets the color contourf gives the band, values above the top
+    level the top color (contourf includes it), values below nothing.
+    x and y are the sample points, as for contourf, so they are the cell
+    centers of the image and its extent reaches half a step beyond them.
+    """
+    layers = 0.5 * (levels[:-1] + levels[1:])
+    band_cmap = colors.ListedColormap(
+        cmap(colors.Normalize(levels[0], levels[-1])(layers))
+    )
+    band_cmap.set_under((0.0, 0.0, 0.0, 0.0))
+    band_cmap.set_over(band_cmap(len(layers) - 1))
+    band_cmap.set_bad((0.0, 0.0, 0.0, 0.0))
+    dx = 0.5 * (x[-1] - x[0]) / (len(x) - 1)
+    dy = 0.5 * (y[-1] - y[0]) / (len(y) - 1)
+    return ax.imshow(
+        z,
+        cmap=band_cmap,
+        norm=colors.BoundaryNorm(levels, len(layers)),
+        origin="lower",
+        aspect="auto",
+        interpolation="nearest",
+        extent=(x[0] - dx, x[-1] + dx, y[0] - dy, y[-1] + dy),
+    )
+
+
+def pixel_columns(fig, ax):
+    ### width of an axes in pixels of the saved image
+    return int(np.ceil(ax.get_position().width * fig.get_figwidth() * fig.dpi))
+
+
+def minmax_decimate(x, y, columns):
+    """Reduces the series y(x) to a min/max envelope ``columns`` slices wide.
+
+    Of every slice the first, lowest, highest and last sample is kept, in
+    their order, so a line or filled area drawn ``columns`` pixels wide
+    looks the same with a fraction of the vertices. x is taken as evenly
+    spaced, short series and columns=None are returned as they are.
+    """
+    n = len(y)
+    if columns is None or n <= 4 * columns:
+        return x, y
+    width = -(-n // columns)
+    rows = -(-n // width)
+    padded = np.empty(rows * width, dtype=y.dtype)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    blocks = padded.reshape(rows, width)
+    start = np.arange(rows) * width
+    index = np.stack(
+        [start, start + blocks.argmin(axis=1), start + blocks.argmax(axis=1)], axis=1
+    )
+    index = np.concatenate([index, start[:, None] + width - 1], axis=1)
+    index = np.minimum(index, n - 1)
+    index.sort(axis=1)
+    index = index.ravel()
+    index = index[np.r_[True, index[1:] != index[:-1]]]
+    return x[index], y[index]
+
 
 def check_lims_list(lims):
     if type(lims) is list:
@@ -20,16 +159,8 @@ def check_lims_list(lims):
         return False
 
 
-def plot_all_noise(fpath, head, traces, lims):
-    # style='fancy' gives 2d hist for response
-    textsize = 7
-    rcParams.update({"font.size": 9})
-
-    logging.info("Making noise plot...")
-    fig = plt.figure(
-        f"Noise plot: Log number: {head['logNum']}      {fpath}",
-        figsize=(16, 8),
-    )
+def noise_axes(fig):
+    ### axes of the noise plot by their part, in the order they are drawn
     ### gridspec devides window into 25 horizontal, 31 vertical fields
     gs1 = GridSpec(
         25,
@@ -41,6 +172,90 @@ def plot_all_noise(fpath, head, traces, lims):
         bottom=0.05,
         top=0.97,
     )
+    axes = {
+        "colorbars": [
+            fig.add_subplot(gs1[0, 0:7]),
+            fig.add_subplot(gs1[0, 8:15]),
+            fig.add_subplot(gs1[0, 16:23]),
+        ],
+        "gyro": [],
+        "debug": [],
+        "d": [],
+        "trans": [],
+    }
+    for i in range(3):
+        axes["gyro"].append(fig.add_subplot(gs1[1 + i * 8 : 1 + i * 8 + 8, 0:7]))
+        axes["debug"].append(fig.add_subplot(gs1[1 + i * 8 : 1 + i * 8 + 8, 8:15]))
+        if i < 2:
+            axes["d"].append(fig.add_subplot(gs1[1 + i * 8 : 1 + i * 8 + 8, 16:23]))
+        else:
+            axes["throttle"] = [
+                fig.add_subplot(gs1[1 + i * 8 : 1 + i * 8 + 4, 16:23]),
+                fig.add_subplot(gs1[1 + i * 8 + 5 : 1 + i * 8 + 8, 16:23]),
+            ]
+        ax3 = fig.add_subplot(gs1[1 + i * 8 : 1 + i * 8 + 8, 24:30])
+        axes["trans"].append((ax3, ax3.twinx()))
+    axes["header"] = fig.add_subplot(gs1[12, -1])
+    axes["filters"] = [
+        fig.add_subplot(gs1[:1, 24:27]),
+        fig.add_subplot(gs1[:1, 27:30]),
+    ]
+
+    for shared in (
+        axes["gyro"],
+        axes["debug"],
+        axes["d"] + axes["throttle"][:1],
+        [ax3 for ax3, ax3r in axes["trans"]],
+    ):
+        for ax in shared[1:]:
+            shared[0].get_shared_x_axes().join(shared[0], ax)
+    return axes
+
+
+def resp_axes(fig, style="ra"):
+    ### axes of the response plot, the gyro, throttle, response and step
+    ### response axes of every trace and the header.
+    ### gridspec devides window into 24 horizontal, 3*10 vertical fields
+    gs1 = GridSpec(
+        24,
+        3 * 10,
+        wspace=0.6,
+        hspace=0.7,
+        left=0.04,
+        right=1.0,
+        bottom=0.05,
+        top=0.97,
+    )
+    axes = {"traces": []}
+    for i in range(3):
+        ax0 = fig.add_subplot(gs1[0:6, i * 10 : i * 10 + 9])
+        ax1 = fig.add_subplot(gs1[6:8, i * 10 : i * 10 + 9], sharex=ax0)
+        ax2 = fig.add_subplot(
+            gs1[9:16, i * 10 : i * 10 + 9], sharex=ax0 if style == "raw" else None
+        )
+        ax3 = fig.add_subplot(gs1[17:, i * 10 : i * 10 + 9])
+        axes["traces"].append((ax0, ax1, ax2, ax3))
+    axes["header"] = fig.add_subplot(gs1[12, -1])
+    return axes
+
+
+def plot_all_noise(
+    fpath,
+    head,
+    traces,
+    lims,
+    show=False,
+    fontsize=FONT_SIZE,
+    textsize=TEXT_SIZE,
+    decimate=False,
+):
+    # style='fancy' gives 2d hist for response,
+    # decimate draws the throttle trace as its min/max per pixel column
+    titlesize = 1.2 * fontsize
+
+    logging.info("Making noise plot...")
+    fig = new_figure(f"Noise plot: Log number: {head['logNum']}      {fpath}", show)
+    axes = noise_axes(fig)
 
     max_noise_gyro = (
         np.max(
@@ -105,16 +320,9 @@ def plot_all_noise(fpath, head, traces, lims):
     else:
         lims = np.array(lims)
 
-    cax_gyro = plt.subplot(gs1[0, 0:7])
-    cax_debug = plt.subplot(gs1[0, 8:15])
-    cax_d = plt.subplot(gs1[0, 16:23])
+    cax_gyro, cax_debug, cax_d = axes["colorbars"]
     cmap = "viridis"
 
-    axes_gyro = []
-    axes_debug = []
-    axes_d = []
-    axes_trans = []
-
     for i, tr in enumerate(traces):
         if tr.noise_gyro["freq_axis"][-1] > 1000:
             pltlim = [0, 1000]
@@ -124,25 +332,23 @@ def plot_all_noise(fpath, head, traces, lims):
                 tr.noise_gyro["freq_axis"][-1],
             ]
         # gyro plots
-        ax0 = plt.subplot(gs1[1 + i * 8 : 1 + i * 8 + 8, 0:7])
-        if len(axes_gyro):
-            axes_gyro[0].get_shared_x_axes().join(axes_gyro[0], ax0)
-        axes_gyro.append(ax0)
-        ax0.set_title(f"gyro {tr.name}", y=0.88, color="w")
-        pc0 = plt.pcolormesh(
+        ax0 = axes["gyro"][i]
+        ax0.set_title(f"gyro {tr.name}", y=0.88, color="w", fontsize=titlesize)
+        pc0 = grid_image(
+            ax0,
             tr.noise_gyro["throt_axis"],
             tr.noise_gyro["freq_axis"],
             tr.noise_gyro["hist2d_sm"] + 1.0,
             norm=colors.LogNorm(vmin=lims[0, 0], vmax=lims[0, 1]),
             cmap=cmap,
         )
-        ax0.set_ylabel("frequency in Hz")
+        ax0.set_ylabel("frequency in Hz", fontsize=fontsize)
         ax0.grid()
         ax0.set_ylim(pltlim)
         if i < 2:
-            plt.setp(ax0.get_xticklabels(), visible=False)
+            setp(ax0.get_xticklabels(), visible=False)
         else:
-            ax0.set_xlabel("throttle in %")
+            ax0.set_xlabel("throttle in %", fontsize=fontsize)
 
         fig.colorbar(pc0, cax_gyro, orientation="horizontal")
         cax_gyro.xaxis.set_ticks_position("top")
@@ -157,28 +363,27 @@ def plot_all_noise(fpath, head, traces, lims):
                 verticalalignment="center",
                 transform=ax0.transAxes,
                 fontdict={"color": "white"},
+                fontsize=fontsize,
             )
 
         # debug plots
-        ax1 = plt.subplot(gs1[1 + i * 8 : 1 + i * 8 + 8, 8:15])
-        if len(axes_debug):
-            axes_debug[0].get_shared_x_axes().join(axes_debug[0], ax1)
-        axes_debug.append(ax1)
-        ax1.set_title(f"debug {tr.name}", y=0.88, color="w")
-        pc1 = plt.pcolormesh(
+        ax1 = axes["debug"][i]
+        ax1.set_title(f"debug {tr.name}", y=0.88, color="w", fontsize=titlesize)
+        pc1 = grid_image(
+            ax1,
             tr.noise_debug["throt_axis"],
             tr.noise_debug["freq_axis"],
             tr.noise_debug["hist2d_sm"] + 1.0,
             norm=colors.LogNorm(vmin=lims[1, 0], vmax=lims[1, 1]),
             cmap=cmap,
         )
-        ax1.set_ylabel("frequency in Hz")
+        ax1.set_ylabel("frequency in Hz", fontsize=fontsize)
         ax1.grid()
         ax1.set_ylim(pltlim)
         if i < 2:
-            plt.setp(ax1.get_xticklabels(), visible=False)
+            setp(ax1.get_xticklabels(), visible=False)
         else:
-            ax1.set_xlabel("throttle in %")
+            ax1.set_xlabel("throttle in %", fontsize=fontsize)
 
         fig.colorbar(pc1, cax_debug, orientation="horizontal")
         cax_debug.xaxis.set_ticks_position("top")
@@ -196,26 +401,25 @@ def plot_all_noise(fpath, head, traces, lims):
                 verticalalignment="center",
                 transform=ax1.transAxes,
                 fontdict={"color": "white"},
+                fontsize=fontsize,
             )
 
         if i < 2:
             # dterm plots
-            ax2 = plt.subplot(gs1[1 + i * 8 : 1 + i * 8 + 8, 16:23])
-            if len(axes_d):
-                axes_d[0].get_shared_x_axes().join(axes_d[0], ax2)
-            axes_d.append(ax2)
-            ax2.set_title(f"D-term {tr.name}", y=0.88, color="w")
-            pc2 = plt.pcolormesh(
+            ax2 = axes["d"][i]
+            ax2.set_title(f"D-term {tr.name}", y=0.88, color="w", fontsize=titlesize)
+            pc2 = grid_image(
+                ax2,
                 tr.noise_d["throt_axis"],
                 tr.noise_d["freq_axis"],
                 tr.noise_d["hist2d_sm"] + 1.0,
                 norm=colors.LogNorm(vmin=lims[2, 0], vmax=lims[2, 1]),
                 cmap=cmap,
             )
-            ax2.set_ylabel("frequency in Hz")
+            ax2.set_ylabel("frequency in Hz", fontsize=fontsize)
             ax2.grid()
             ax2.set_ylim(pltlim)
-            plt.setp(ax2.get_xticklabels(), visible=False)
+            setp(ax2.get_xticklabels(), visible=False)
 
             fig.colorbar(pc2, cax_d, orientation="horizontal")
             cax_d.xaxis.set_ticks_position("top")
@@ -230,12 +434,12 @@ def plot_all_noise(fpath, head, traces, lims):
                     verticalalignment="center",
                     transform=ax2.transAxes,
                     fontdict={"color": "white"},
+                    fontsize=fontsize,
                 )
 
         else:
             # throttle plots
-            ax21 = plt.subplot(gs1[1 + i * 8 : 1 + i * 8 + 4, 16:23])
-            ax22 = plt.subplot(gs1[1 + i * 8 + 5 : 1 + i * 8 + 8, 16:23])
+            ax21, ax22 = axes["throttle"]
             ax21.bar(
                 tr.throt_scale[:-1],
                 tr.throt_hist * 100.0,
@@ -245,7 +449,6 @@ def plot_all_noise(fpath, head, traces, lims):
                 alpha=0.2,
                 label="throttle distribution",
             )
-            axes_d[0].get_shared_x_axes().join(axes_d[0], ax21)
             ax21.vlines(
                 head["tpa_percent"],
                 0.0,
@@ -256,15 +459,17 @@ def plot_all_noise(fpath, head, traces, lims):
             )
             ax21.grid()
             ax21.set_ylim([0.0, np.max(tr.throt_hist) * 100.0 * 1.1])
-            ax21.set_xlabel("throttle in %")
-            ax21.set_ylabel("usage %")
+            ax21.set_xlabel("throttle in %", fontsize=fontsize)
+            ax21.set_ylabel("usage %", fontsize=fontsize)
             ax21.set_xlim([0.0, 100.0])
             handles, labels = ax21.get_legend_handles_labels()
-            ax21.legend(handles[::-1], labels[::-1])
+            ax21.legend(handles[::-1], labels[::-1], fontsize=fontsize)
+            columns = pixel_columns(fig, ax22) if decimate else None
+            throt_time, throttle = minmax_decimate(tr.time, tr.throttle, columns)
             ax22.fill_between(
-                tr.time,
+                throt_time,
                 0.0,
-                tr.throttle,
+                throttle,
                 label="throttle input",
                 facecolors="black",
                 alpha=0.2,
@@ -278,18 +483,15 @@ def plot_all_noise(fpath, head, traces, lims):
                 alpha=0.5,
             )
 
-            ax22.set_ylabel("throttle in %")
-            ax22.legend()
+            ax22.set_ylabel("throttle in %", fontsize=fontsize)
+            ax22.legend(fontsize=fontsize)
             ax22.grid()
             ax22.set_ylim([0.0, 100.0])
             ax22.set_xlim([tr.time[0], tr.time[-1]])
-            ax22.set_xlabel("time in s")
+            ax22.set_xlabel("time in s", fontsize=fontsize)
 
         # transmission plots
-        ax3 = plt.subplot(gs1[1 + i * 8 : 1 + i * 8 + 8, 24:30])
-        if len(axes_trans):
-            axes_trans[0].get_shared_x_axes().join(axes_trans[0], ax3)
-        axes_trans.append(ax3)
+        ax3, ax3r = axes["trans"][i]
         ax3.fill_between(
             tr.noise_gyro["freq_axis"][:-1],
             0,
@@ -298,29 +500,26 @@ def plot_all_noise(fpath, head, traces, lims):
             alpha=0.2,
         )
         ax3.set_ylim(lims[3])
-        ax3.set_ylabel(f"{tr.name} gyro noise a.u.")
+        ax3.set_ylabel(f"{tr.name} gyro noise a.u.", fontsize=fontsize)
         ax3.grid()
-        ax3r = plt.twinx(ax3)
         ax3r.plot(
             tr.noise_gyro["freq_axis"][:-1],
             tr.filter_trans * 100.0,
             label=f"{tr.name} filter transmission",
         )
-        ax3r.set_ylabel("transmission in %")
+        ax3r.set_ylabel("transmission in %", fontsize=fontsize)
         ax3r.set_ylim([0.0, 100.0])
-        ax3r.set_xlim(
-            [tr.noise_gyro["freq_axis"][0], tr.noise_gyro["freq_axis"][-2]]
-        )
+        ax3r.set_xlim([tr.noise_gyro["freq_axis"][0], tr.noise_gyro["freq_axis"][-2]])
         lines, labels = ax3.get_legend_handles_labels()
         lines2, labels2 = ax3r.get_legend_handles_labels()
-        ax3r.legend(lines + lines2, labels + labels2, loc=1)
+        ax3r.legend(lines + lines2, labels + labels2, loc=1, fontsize=fontsize)
         if i < 2:
-            plt.setp(ax3.get_xticklabels(), visible=False)
+            setp(ax3.get_xticklabels(), visible=False)
         else:
-            ax3.set_xlabel("frequency in hz")
+            ax3.set_xlabel("frequency in hz", fontsize=fontsize)
 
     meanfreq = 1.0 / (traces[0].time[1] - traces[0].time[0])
-    ax4 = plt.subplot(gs1[12, -1])
+    ax4 = axes["header"]
     t = (
         f"PID-Analyzer {__version__}"
         f"| Betaflight: Version {head['version']}"
@@ -350,8 +549,7 @@ def plot_all_noise(fpath, head, traces, lims):
     )
     ax4.axis("off")
 
-    ax5l = plt.subplot(gs1[:1, 24:27])
-    ax5r = plt.subplot(gs1[:1, 27:30])
+    ax5l, ax5r = axes["filters"]
     ax5l.axis("off")
     ax5r.axis("off")
     filt_settings_l = (
@@ -368,44 +566,46 @@ def plot_all_noise(fpath, head, traces, lims):
     ax5l.text(0, 0, filt_settings_l, ha="left", fontsize=textsize)
     ax5r.text(0, 0, filt_settings_r, ha="left", fontsize=textsize)
 
+    set_fontsize(fig, fontsize)
     return fig
 
-def plot_all_resp(fpath, head, traces, threshold, style="ra"):
-    textsize = 7
-    titelsize = 10
-    rcParams.update({"font.size": 9})
+
+def plot_all_resp(
+    fpath,
+    head,
+    traces,
+    threshold,
+    style="ra",
+    show=False,
+    fontsize=FONT_SIZE,
+    textsize=TEXT_SIZE,
+    decimate=False,
+):
+    # decimate draws the gyro, input and throttle traces as their min/max per
+    # pixel column
+    titlesize = 1.2 * fontsize
     logging.info("Making PID plot...")
-    fig = plt.figure(
-        f"Response plot: Log number: {head['logNum']}       {fpath}",
-        figsize=(16, 8),
-    )
-    ### gridspec devides window into 24 horizontal, 3*10 vertical fields
-    gs1 = GridSpec(
-        24,
-        3 * 10,
-        wspace=0.6,
-        hspace=0.7,
-        left=0.04,
-        right=1.0,
-        bottom=0.05,
-        top=0.97,
-    )
+    fig = new_figure(f"Response plot: Log number: {head['logNum']}       {fpath}", show)
+    axes = resp_axes(fig, style)
 
     for i, tr in enumerate(traces):
-        ax0 = plt.subplot(gs1[0:6, i * 10 : i * 10 + 9])
-        plt.title(tr.name)
-        plt.plot(tr.time, tr.gyro, label=f"{tr.name} gyro")
-        plt.plot(tr.time, tr.input, label=f"{tr.name} loop input")
-        plt.ylabel("degrees/second")
+        ax0, ax1, ax2, ax3 = axes["traces"][i]
+        ax0.set_title(tr.name, fontsize=titlesize)
+        columns = pixel_columns(fig, ax0) if decimate else None
+        ax0.plot(*minmax_decimate(tr.time, tr.gyro, columns), label=f"{tr.name} gyro")
+        ax0.plot(
+            *minmax_decimate(tr.time, tr.input, columns),
+            label=f"{tr.name} loop input",
+        )
+        ax0.set_ylabel("degrees/second", fontsize=fontsize)
         ax0.get_yaxis().set_label_coords(-0.1, 0.5)
-        plt.grid()
+        ax0.grid()
         tracelim = np.max([np.abs(tr.gyro), np.abs(tr.input)])
-        plt.ylim([-tracelim * 1.1, tracelim * 1.1])
-        plt.legend(loc=1)
-        plt.setp(ax0.get_xticklabels(), visible=False)
+        ax0.set_ylim([-tracelim * 1.1, tracelim * 1.1])
+        ax0.legend(loc=1, fontsize=fontsize)
+        setp(ax0.get_xticklabels(), visible=False)
 
-        ax1 = plt.subplot(gs1[6:8, i * 10 : i * 10 + 9], sharex=ax0)
-        plt.hlines(
+        ax1.hlines(
             head["tpa_percent"],
             tr.time[0],
             tr.time[-1],
@@ -413,92 +613,77 @@ def plot_all_resp(fpath, head, traces, threshold, style="ra"):
             colors="red",
             alpha=0.5,
         )
-        plt.fill_between(
-            tr.time, 0.0, tr.throttle, label="throttle", color="grey", alpha=0.2
+        throt_time, throttle = minmax_decimate(tr.time, tr.throttle, columns)
+        ax1.fill_between(
+            throt_time, 0.0, throttle, label="throttle", color="grey", alpha=0.2
         )
-        plt.ylabel("throttle %")
+        ax1.set_ylabel("throttle %", fontsize=fontsize)
         ax1.get_yaxis().set_label_coords(-0.1, 0.5)
-        plt.grid()
-        plt.xlim([tr.time[0], tr.time[-1]])
-        plt.ylim([0, 100])
-        plt.legend(loc=1)
-        plt.xlabel("log time in s")
+        ax1.grid()
+        ax1.set_xlim([tr.time[0], tr.time[-1]])
+        ax1.set_ylim([0, 100])
+        ax1.legend(loc=1, fontsize=fontsize)
+        ax1.set_xlabel("log time in s", fontsize=fontsize)
 
         if style == "raw":
             ###old raw data plot.
-            plt.setp(ax1.get_xticklabels(), visible=False)
-            ax2 = plt.subplot(gs1[9:16, i * 10 : i * 10 + 9], sharex=ax0)
-            plt.pcolormesh(
-                tr.avr_t, tr.time_resp, np.transpose(tr.spec_sm), vmin=0, vmax=2.0
+            setp(ax1.get_xticklabels(), visible=False)
+            grid_image(
+                ax2,
+                tr.avr_t,
+                tr.time_resp,
+                np.transpose(tr.spec_sm),
+                vmin=0,
+                vmax=2.0,
             )
-            plt.ylabel("response time in s")
+            ax2.set_ylabel("response time in s", fontsize=fontsize)
             ax2.get_yaxis().set_label_coords(-0.1, 0.5)
-            plt.xlabel("log time in s")
-            plt.xlim([tr.avr_t[0], tr.avr_t[-1]])
+            ax2.set_xlabel("log time in s", fontsize=fontsize)
+            ax2.set_xlim([tr.avr_t[0], tr.avr_t[-1]])
 
         else:
             ###response vs throttle plot. more useful.
-            ax2 = plt.subplot(gs1[9:16, i * 10 : i * 10 + 9])
-            plt.title(f"{tr.name} response", y=0.88, color="w")
-            plt.pcolormesh(
+            ax2.set_title(f"{tr.name} response", y=0.88, color="w", fontsize=titlesize)
+            grid_image(
+                ax2,
                 tr.thr_response["throt_scale"],
                 tr.time_resp,
                 tr.thr_response["hist2d_norm"],
                 vmin=0.0,
                 vmax=2.0,
             )
-            plt.ylabel("response time in s")
+            ax2.set_ylabel("response time in s", fontsize=fontsize)
             ax2.get_yaxis().set_label_coords(-0.1, 0.5)
-            plt.xlabel("throttle in %")
-            plt.xlim([0.0, 100.0])
-
-        theCM = plt.cm.get_cmap("Blues")
-        theCM._init()
-        alphas = np.abs(np.linspace(0.0, 0.5, theCM.N, dtype=np.float64))
-        theCM._lut[:-3, -1] = alphas
-        ax3 = plt.subplot(gs1[17:, i * 10 : i * 10 + 9])
-        plt.contourf(
-            *tr.resp_low[2],
-            cmap=theCM,
-            linestyles=None,
-            antialiased=True,
-            levels=np.linspace(0, 1, 20, dtype=np.float64)
-        )
-        plt.plot(
+            ax2.set_xlabel("throttle in %", fontsize=fontsize)
+            ax2.set_xlim([0.0, 100.0])
+
+        levels = np.linspace(0, 1, 20, dtype=np.float64)
+        band_image(ax3, *tr.resp_low[2], alpha_cmap("Blues"), levels)
+        ax3.plot(
             tr.time_resp,
             tr.resp_low[0],
             label=f"{tr.name} step response (<{int(threshold)})  PID {head[tr.name + 'PID']}",
         )
 
         if tr.high_mask.sum() > 0:
-            theCM = plt.cm.get_cmap("Oranges")
-            theCM._init()
-            alphas = np.abs(np.linspace(0.0, 0.5, theCM.N, dtype=np.float64))
-            theCM._lut[:-3, -1] = alphas
-            plt.contourf(
-                *tr.resp_high[2],
-                cmap=theCM,
-                linestyles=None,
-                antialiased=True,
-                levels=np.linspace(0, 1, 20, dtype=np.float64)
-            )
-            plt.plot(
+            band_image(ax3, *tr.resp_high[2], alpha_cmap("Oranges"), levels)
+            ax3.plot(
                 tr.time_resp,
                 tr.resp_high[0],
                 label=f"{tr.name} step response (>{int(threshold)})  PID {head[tr.name + 'PID']}",
             )
-        plt.xlim([-0.001, 0.501])
+        ax3.set_xlim([-0.001, 0.501])
 
-        plt.legend(loc=1)
-        plt.ylim([0.0, 2])
-        plt.ylabel("strength")
+        ax3.legend(loc=1, fontsize=fontsize)
+        ax3.set_ylim([0.0, 2])
+        ax3.set_ylabel("strength", fontsize=fontsize)
         ax3.get_yaxis().set_label_coords(-0.1, 0.5)
-        plt.xlabel("response time in s")
+        ax3.set_xlabel("response time in s", fontsize=fontsize)
 
-        plt.grid()
+        ax3.grid()
 
     meanfreq = 1.0 / (traces[0].time[1] - traces[0].time[0])
-    ax4 = plt.subplot(gs1[12, -1])
+    ax4 = axes["header"]
     t = (
         f"PID-Analyzer {__version__}"
         f" | Betaflight: Version {head['version']}"
@@ -514,7 +699,7 @@ def plot_all_resp(fpath, head, traces, threshold, style="ra"):
         f"| vbatComp: {head['vbatComp']}"
     )
 
-    plt.text(
+    ax4.text(
         0,
         0,
         t,
@@ -526,5 +711,5 @@ def plot_all_resp(fpath, head, traces, threshold, style="ra"):
         fontsize=textsize,
     )
     ax4.axis("off")
+    set_fontsize(fig, fontsize)
     return fig
-
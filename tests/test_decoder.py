@@ -0,0 +1,96 @@
+"""pidanalyze.decoder against the values it has to decode to.
+
+Every log in tests/logs (.BBL, .BFL, .TXT) with the csv blackbox_decode
+writes for it next to it, LOG00001.01.csv for the first session of
+LOG00001.BFL, is decoded natively and compared column by column:
+
+    blackbox_decode tests/logs/LOG00001.BFL
+"""
+
+import glob
+import os
+import sys
+
+import numpy as np
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.join(REPO, "benchmarks"))
+
+from pidanalyze import csvreader, decoder, loader  # noqa: E402
+from synthetic import BBL_MINTHROTTLE, make_bbl, signed_vb, unsigned_vb  # noqa: E402
+
+LOGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+
+def reference_sessions():
+    ### (log, session number, csv) of every session with a blackbox_decode csv
+    found = []
+    for path in sorted(glob.glob(os.path.join(LOGS, "*.*"))):
+        stem, ext = os.path.splitext(path)
+        if ext.upper() not in (".BBL", ".BFL", ".TXT"):
+            continue
+        for csv_path in sorted(glob.glob(glob.escape(stem) + ".[0-9][0-9].csv")):
+            found.append((path, int(csv_path[-6:-4]), csv_path))
+    return found
+
+
+@pytest.mark.parametrize(
+    "path, number, csv_path",
+    reference_sessions()
+    or [
+        pytest.param(None, None, None, marks=pytest.mark.skip("no logs in tests/logs"))
+    ],
+)
+def test_blackbox_decode_csv(path, number, csv_path):
+    with loader.SessionIndex(path) as index:
+        sessions = {session[0]: session[1:] for session in index.sessions}
+        assert number in sessions, "session dropped as too short"
+        offset, length = sessions[number]
+        result = decoder.decode_session(
+            index.buf, offset, offset + length, wanted=loader.WANTED_FIELDS
+        )
+    expected = csvreader.read_csv(csv_path, loader.WANTED_FIELDS)
+    assert expected.keys() == result.keys()
+    for key in expected:
+        np.testing.assert_array_equal(expected[key], result[key], err_msg=key)
+
+
+def test_synthetic_session():
+    buf, expected = make_bbl(3000, seed=1)
+    result = decoder.decode_session(buf)
+    assert expected.keys() == result.keys()
+    for key in expected:
+        np.testing.assert_array_equal(expected[key], result[key], err_msg=key)
+
+
+def test_fields_wrap_to_32_bits():
+    ### I frames of an unsigned field below its predictor and of a signed
+    ### field written as unsigned, cast to uint32 and int32 like blackbox_decode
+    header = "".join(
+        f"H {line}\n"
+        for line in [
+            "Data version:2",
+            "I interval:1",
+            "P interval:1/1",
+            "Field I name:loopIteration,time,rcCommand[3],debug[0]",
+            "Field I signed:0,0,0,1",
+            "Field I predictor:0,0,4,0",
+            "Field I encoding:1,1,0,1",
+            "Field P predictor:6,2,1,1",
+            "Field P encoding:9,0,0,0",
+            f"minthrottle:{BBL_MINTHROTTLE}",
+        ]
+    ).encode()
+    frames = b"".join(
+        b"I"
+        + unsigned_vb(i)
+        + unsigned_vb(1000 + 125 * i)
+        + signed_vb(-BBL_MINTHROTTLE - i)
+        + unsigned_vb(-i)
+        for i in range(3)
+    )
+    result = decoder.decode_session(header + frames + b"E\xffEnd of log\x00")
+    np.testing.assert_array_equal(result["rcCommand[3]"], [0, 2**32 - 1, 2**32 - 2])
+    np.testing.assert_array_equal(result["debug[0]"], [0, -1, -2])